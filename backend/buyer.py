@@ -1,12 +1,39 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List
-from store import get_all_listings, add_listing
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import List, Optional
+from email.utils import formatdate, parsedate_to_datetime
+from store import query_listings, get_nearby_listings, add_listing, next_order_id, get_store_version, add_store_listener
+from search import search_listings
+from orders import InsufficientQuantityError, match_order
+from cache import LRUCache
+from feed import ListingFeed
+from pricing import get_price_range_for_crop, get_price_ranges, get_price_version
 from datetime import datetime
+import os
+import time
+import zlib
 
 router = APIRouter()
 
+# Page size limits for /buyer/listings
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Largest search radius accepted by /buyer/listings/nearby
+MAX_RADIUS_KM = 500
+
+# Serialized /buyer/listings pages, keyed by ((boot, store version, price generation), query)
+FEED_CACHE_SIZE = 512
+feed_cache = LRUCache(maxsize=FEED_CACHE_SIZE)
+
+# The store version and price generation count from 0 again after a
+# restart, so ETags also carry this per-process token: a tag from before
+# a restart or deploy never matches a page served after it
+BOOT_EPOCH = f"{time.time_ns():x}{os.getpid():x}"
+
 class ListingItem(BaseModel):
+    id: int
     crop: str
     quantity: int
     min_price: float
@@ -14,6 +41,22 @@ class ListingItem(BaseModel):
     quality_verified: bool
     location: str = "Village X"
     timestamp: str = None
+    lat: Optional[float] = None
+    lon: Optional[float] = None
+
+listing_page_adapter = TypeAdapter(List[ListingItem])
+
+class NearbyListingItem(ListingItem):
+    distance_km: float
+
+class SearchResultItem(ListingItem):
+    score: float
+
+class OrderAllocation(BaseModel):
+    listing_id: int
+    quantity: int
+    price: Optional[float] = None
+    location: str = "Village X"
 
 class OrderConfirmation(BaseModel):
     message: str
@@ -21,43 +64,99 @@ class OrderConfirmation(BaseModel):
     crop: str = None
     quantity: int = None
     timestamp: str = None
+    allocations: List[OrderAllocation] = []
 
-# Simple order counter for demo
-order_counter = 0
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in tags)
 
-def get_price_range_for_crop(crop: str) -> tuple:
+def not_modified_since(if_modified_since: str, modified_at: float) -> bool:
+    """Check an If-Modified-Since header against a modification time"""
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have one-second resolution
+    return int(modified_at) <= since
+
+def to_listing_item(listing: dict, price_range: tuple = None) -> dict:
     """
-    Get realistic price range for a crop.
-    In production, this would call the ML model.
+    Format a store listing for the buyer view.
+    
+    Args:
+        listing: Listing dictionary from the store
+        price_range: (min_price, max_price) for its crop, looked up if omitted
     
-    For now, using dummy values based on crop type.
+    Returns:
+        Keyword arguments for ListingItem
     """
-    price_ranges = {
-        "tomato": (25, 35),
-        "potato": (15, 25),
-        "onion": (20, 30),
-        "carrot": (30, 40),
-        "cucumber": (25, 35),
-        "eggplant": (30, 45),
-    }
+    if price_range is None:
+        price_range = get_price_range_for_crop(listing["crop"])
+    min_price, max_price = price_range
+    return dict(
+        id=listing["id"],
+        crop=listing["crop"],
+        quantity=listing["quantity"],
+        min_price=float(min_price),
+        max_price=float(max_price),
+        quality_verified=listing.get("quality_verified", True),
+        location=listing.get("location", "Village X"),
+        timestamp=listing.get("timestamp", datetime.now().isoformat()),
+        lat=listing.get("lat"),
+        lon=listing.get("lon")
+    )
+
+def to_listing_items(listings: List[dict]) -> List[dict]:
+    """
+    Format several listings, pricing each distinct crop once.
+    
+    Args:
+        listings: Listing dictionaries from the store
     
-    # Default range if crop not in mapping
-    min_price, max_price = price_ranges.get(crop.lower(), (20, 40))
-    return min_price, max_price
+    Returns:
+        Keyword arguments for ListingItem, one per listing
+    """
+    price_ranges = get_price_ranges(listing["crop"] for listing in listings)
+    return [to_listing_item(listing, price_ranges[listing["crop"]]) for listing in listings]
 
 @router.get("/buyer/listings", response_model=List[ListingItem])
-async def get_buyer_listings():
+async def get_buyer_listings(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after_id: int = Query(0, ge=0),
+    crop: Optional[str] = None,
+    location: Optional[str] = None,
+    min_quantity: Optional[int] = Query(None, ge=0),
+    quality_verified: Optional[bool] = None
+):
     """
-    Get all farmer listings for buyers.
+    Get one page of farmer listings for buyers, oldest first.
     
     Includes:
     - Crop name and quantity
     - AI-predicted fair price range
     - IoT-verified quality status
     
+    Pagination is keyset-based: pass the `X-Next-After-Id` response header
+    (the ID of the last listing on this page) as `after_id` to get the next
+    page. The header is absent on the last page. Filters are answered from
+    the store indexes, so each request costs roughly one page of work.
+    
+    Responses carry an `ETag` derived from the process, store version and query,
+    plus `Last-Modified`. Polling clients should send them back as
+    `If-None-Match` / `If-Modified-Since` and get `304 Not Modified` until
+    a listing changes. Serialized pages are cached per (version, query).
+    
+    Example:
+    GET /buyer/listings?crop=tomato&min_quantity=20&limit=2
+    
     Example response:
     [
       {
+        "id": 7,
         "crop": "tomato",
         "quantity": 50,
         "min_price": 28,
@@ -69,38 +168,172 @@ async def get_buyer_listings():
     ]
     """
     
-    # Get all listings from in-memory store
-    all_listings = get_all_listings()
+    store_version, store_modified_at = get_store_version()
+    price_generation, prices_updated_at = get_price_version()
+    # Pages change with the listings and with the price model
+    version = (BOOT_EPOCH, store_version, price_generation)
+    modified_at = max(store_modified_at, prices_updated_at)
+    query_key = (limit, after_id, crop, location, min_quantity, quality_verified)
+    etag = f'"{BOOT_EPOCH}.{store_version}.{price_generation}-{zlib.crc32(repr(query_key).encode()):08x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified_at, usegmt=True),
+        "Cache-Control": "no-cache"
+    }
     
-    # Format listings for buyer view
-    buyer_listings = []
-    for listing in all_listings:
-        min_price, max_price = get_price_range_for_crop(listing["crop"])
-        
-        buyer_listing = ListingItem(
-            crop=listing["crop"],
-            quantity=listing["quantity"],
-            min_price=float(min_price),
-            max_price=float(max_price),
-            quality_verified=True,  # Demo: always true for now
-            location=listing.get("location", "Village X"),
-            timestamp=listing.get("timestamp", datetime.now().isoformat())
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=headers)
+    elif if_modified_since is not None and not_modified_since(if_modified_since, modified_at):
+        return Response(status_code=304, headers=headers)
+    
+    cached = feed_cache.get((version, query_key))
+    if cached is None:
+        # Fetch one extra listing to know whether another page exists
+        page = query_listings(
+            after_id=after_id,
+            limit=limit + 1,
+            crop=crop,
+            location=location,
+            min_quantity=min_quantity,
+            quality_verified=quality_verified
         )
-        buyer_listings.append(buyer_listing)
+        next_after_id = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_after_id = str(page[-1]["id"])
+        
+        # Format listings for buyer view
+        items = [ListingItem(**item) for item in to_listing_items(page)]
+        cached = (listing_page_adapter.dump_json(items), next_after_id)
+        feed_cache.put((version, query_key), cached)
     
-    return buyer_listings
+    body, next_after_id = cached
+    if next_after_id is not None:
+        headers["X-Next-After-Id"] = next_after_id
+    return Response(content=body, media_type="application/json", headers=headers)
+
+listing_feed = ListingFeed(lambda listing: ListingItem(**to_listing_item(listing)).model_dump())
+add_store_listener(listing_feed.publish)
+
+@router.get("/buyer/listings/stream")
+async def stream_buyer_listings(crop: Optional[str] = None):
+    """
+    Live listing updates as Server-Sent Events.
+    
+    Instead of polling /buyer/listings, open this stream first, then fetch
+    the listings once and apply the deltas as they arrive:
+    - `added` / `updated`: the listing in buyer view (same shape as /buyer/listings)
+    - `removed`: {"id": ...}
+    - `cleared`: all listings were removed
+    - `reset`: this client fell too far behind; refetch /buyer/listings and reconnect
+    
+    Args:
+        crop: Only stream changes for this crop
+    
+    Example:
+    GET /buyer/listings/stream?crop=tomato
+    
+    event: added
+    data: {"id":12,"crop":"tomato","quantity":50,...}
+    """
+    return StreamingResponse(
+        listing_feed.stream(crop=crop),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/buyer/listings/nearby", response_model=List[NearbyListingItem])
+async def get_nearby_buyer_listings(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(25, gt=0, le=MAX_RADIUS_KM),
+    crop: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE)
+):
+    """
+    Get available listings near the buyer, nearest first.
+    
+    Only listings added with lat/lon are searchable. The store's spatial
+    grid only visits cells overlapping the search radius, so the cost
+    depends on how much produce is nearby, not on the whole marketplace.
+    
+    Example:
+    GET /buyer/listings/nearby?lat=28.61&lon=77.21&radius_km=30&crop=tomato
+    
+    Example response:
+    [
+      {
+        "id": 12,
+        "crop": "tomato",
+        "quantity": 50,
+        ...
+        "lat": 28.65,
+        "lon": 77.23,
+        "distance_km": 4.87
+      }
+    ]
+    """
+    nearby = get_nearby_listings(lat, lon, radius_km, limit=limit, crop=crop)
+    items = to_listing_items([listing for _, listing in nearby])
+    return [
+        NearbyListingItem(**item, distance_km=round(distance, 3))
+        for item, (distance, _) in zip(items, nearby)
+    ]
+
+@router.get("/buyer/search", response_model=List[SearchResultItem])
+async def search_buyer_listings(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)
+):
+    """
+    Search listings by crop and location in English, Hindi or Hinglish.
+    
+    Crop words are resolved through the voice CROP_MAPPING aliases, so
+    "tamatar" and "tomato" find the same listings; other words match
+    location names. Listings matching every word rank first, then
+    partial matches (crop matches above location matches), newest first.
+    
+    Example:
+    GET /buyer/search?q=tamatar delhi
+    
+    Example response:
+    [
+      {
+        "id": 9,
+        "crop": "tomato",
+        "location": "Delhi",
+        ...
+        "score": 3.0
+      }
+    ]
+    """
+    results = search_listings(q, limit=limit)
+    items = to_listing_items([listing for _, listing in results])
+    return [
+        SearchResultItem(**item, score=score)
+        for item, (score, _) in zip(items, results)
+    ]
 
 @router.post("/buyer/order", response_model=OrderConfirmation)
-async def confirm_order(crop: str, quantity: int):
+async def confirm_order(crop: str, quantity: int, allow_partial: bool = False):
     """
     Confirm an order for a crop.
     
+    The order is matched against available listings of the crop, cheapest
+    asking price first and then oldest, and may be split across several
+    listings. The allocated kilos are reserved (deducted from each listing)
+    atomically, so concurrent buyers can't oversell a listing.
+    
     Args:
         crop: Name of the crop to order
         quantity: Quantity to order (in kilos)
+        allow_partial: Accept a partial fill instead of failing with 409
     
     Returns:
-        Order confirmation with order ID
+        Order confirmation with order ID and per-listing allocations
     
     Example:
     POST /buyer/order?crop=tomato&quantity=25
@@ -111,32 +344,53 @@ async def confirm_order(crop: str, quantity: int):
       "order_id": 1,
       "crop": "tomato",
       "quantity": 25,
-      "timestamp": "2025-12-24T15:30:00"
+      "timestamp": "2025-12-24T15:30:00",
+      "allocations": [
+        {"listing_id": 3, "quantity": 20, "price": 24.0, "location": "Delhi"},
+        {"listing_id": 5, "quantity": 5, "price": 26.0, "location": "Agra"}
+      ]
     }
     """
     
-    global order_counter
-    
     if not crop or quantity <= 0:
         raise HTTPException(
             status_code=400,
             detail="Invalid crop or quantity"
         )
     
-    order_counter += 1
+    try:
+        allocations = match_order(crop, quantity, allow_partial=allow_partial)
+    except InsufficientQuantityError as e:
+        raise HTTPException(
+            status_code=409,
+            detail=str(e)
+        )
+    
+    if not allocations:
+        raise HTTPException(
+            status_code=409,
+            detail=f"No {crop} available right now"
+        )
+    
+    filled = sum(allocation["quantity"] for allocation in allocations)
     
     return OrderConfirmation(
-        message="Order confirmed successfully",
-        order_id=order_counter,
+        message="Order confirmed successfully" if filled == quantity else "Order partially filled",
+        order_id=next_order_id(),
         crop=crop,
-        quantity=quantity,
-        timestamp=datetime.now().isoformat()
+        quantity=filled,
+        timestamp=datetime.now().isoformat(),
+        allocations=[OrderAllocation(**allocation) for allocation in allocations]
     )
 
 class AddListingRequest(BaseModel):
     crop: str
-    quantity: int
+    quantity: int = Field(..., gt=0)
     location: str = "Village X"
+    quality_verified: bool = True
+    lat: Optional[float] = Field(None, ge=-90, le=90)
+    lon: Optional[float] = Field(None, ge=-180, le=180)
+    price: Optional[float] = Field(None, gt=0)
 
 @router.post("/farmer/add-listing")
 async def farmer_add_listing(request: AddListingRequest):
@@ -150,6 +404,10 @@ async def farmer_add_listing(request: AddListingRequest):
         crop: Name of the crop
         quantity: Quantity in kilos
         location: Farmer's location
+        quality_verified: Whether the produce passed IoT quality checks
+        lat: Optional latitude, to appear in nearby searches
+        lon: Optional longitude, to appear in nearby searches
+        price: Optional asking price in ₹/kg (cheaper listings match orders first)
     
     Returns:
         Listing details with ID
@@ -158,6 +416,10 @@ async def farmer_add_listing(request: AddListingRequest):
         crop=request.crop,
         quantity=request.quantity,
         location=request.location,
-        language="Hindi"
+        language="Hindi",
+        quality_verified=request.quality_verified,
+        lat=request.lat,
+        lon=request.lon,
+        price=request.price
     )
     return listing
@@ -0,0 +1,125 @@
+import asyncio
+import json
+import os
+from typing import AsyncIterator, Callable, Dict, Optional, Set
+from store import normalize_key
+
+# Per-subscriber queue bound; a client this far behind gets a reset instead
+SUBSCRIBER_QUEUE_SIZE = 256
+# Seconds between SSE keepalive comments on an idle stream
+KEEPALIVE_SECONDS = 15.0
+# Seconds between checks for other workers' changes while clients are
+# connected (GAON_STORE_ENGINE=shared; 0 = off)
+SYNC_INTERVAL_SECONDS = float(os.environ.get("GAON_FEED_SYNC_INTERVAL", "1"))
+
+
+class Subscriber:
+    """One connected client: a bounded queue of SSE frames on its event loop"""
+
+    __slots__ = ("queue", "loop", "crop_key", "overflowed")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, crop: Optional[str] = None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.loop = loop
+        self.crop_key = normalize_key(crop) if crop else None
+        self.overflowed = False
+
+    def offer(self, frame: str):
+        """Enqueue a frame without ever blocking the publisher (runs on self.loop)"""
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # Slow consumer: stop queueing and tell it to resync from GET
+            self.overflowed = True
+            # Wake a reader blocked on get() so it notices promptly
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+def sse_frame(event: str, data: Dict) -> str:
+    """Format one Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class ListingFeed:
+    """
+    Fan-out of listing changes to streaming clients.
+
+    publish() is registered as a store listener. Each change is formatted
+    and serialized once, then offered to every subscriber's bounded queue
+    (via call_soon_threadsafe when the change happens off the event loop).
+    A subscriber whose queue fills up is dropped from the delta stream and
+    sent a "reset" event telling it to refetch /buyer/listings, so one slow
+    client can never hold memory or back-pressure the store.
+    """
+
+    def __init__(self, format_listing: Callable[[Dict], Dict]):
+        self.format_listing = format_listing
+        self.subscribers: Set[Subscriber] = set()
+
+    def publish(self, event: str, listing: Optional[Dict]):
+        """Store listener: broadcast one change as a delta"""
+        if not self.subscribers:
+            return
+        if event == "removed":
+            frame = sse_frame(event, {"id": listing["id"]})
+        elif event == "cleared":
+            frame = sse_frame(event, {})
+        else:
+            frame = sse_frame(event, self.format_listing(listing))
+        crop_key = normalize_key(listing["crop"]) if listing is not None else None
+
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        for subscriber in list(self.subscribers):
+            if subscriber.crop_key is not None and crop_key is not None and subscriber.crop_key != crop_key:
+                continue
+            if subscriber.loop is running:
+                subscriber.offer(frame)
+            else:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, frame)
+
+    async def follow(self, sync: Callable[[], None], interval: float = SYNC_INTERVAL_SECONDS):
+        """
+        Pull other workers' changes into the feed while anyone is subscribed.
+
+        With a shared store, changes committed by other workers are only
+        applied (and so published) when this worker syncs, which otherwise
+        happens on local requests; an idle worker's subscribers would hear
+        nothing. `sync` is cheap when nothing changed (one PRAGMA
+        data_version read) and runs off the event loop.
+        """
+        if interval <= 0:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            if not self.subscribers:
+                continue
+            try:
+                await asyncio.to_thread(sync)
+            except Exception as e:
+                print(f"[ERROR] Listing feed sync failed: {str(e)}")
+
+    async def stream(self, crop: Optional[str] = None) -> AsyncIterator[str]:
+        """SSE frames for one client until it disconnects or falls behind"""
+        subscriber = Subscriber(asyncio.get_running_loop(), crop=crop)
+        self.subscribers.add(subscriber)
+        try:
+            yield ": connected\n\n"
+            while True:
+                try:
+                    frame = await asyncio.wait_for(subscriber.queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if frame is None or subscriber.overflowed:
+                    yield sse_frame("reset", {"reason": "client too slow, refetch /api/buyer/listings"})
+                    return
+                yield frame
+        finally:
+            self.subscribers.discard(subscriber)
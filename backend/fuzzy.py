@@ -0,0 +1,167 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from cache import LRUCache
+import numpy as np
+
+# Spelling variants of romanized Hindi that ASR output mixes freely
+# ("tamaatar", "piyaj"/"pyaz", "phool"/"fool"); applied to aliases and
+# queries alike before indexing
+TRANSLITERATION_VARIANTS = (("ee", "i"), ("oo", "u"), ("ph", "f"), ("z", "j"), ("w", "v"), ("q", "k"))
+REPEATED_CHARS = re.compile(r"(.)\1+")
+
+# Queries shorter than this (after normalization) are never fuzzy-matched
+MIN_FUZZY_LENGTH = 4
+
+# Resolved queries (including misses), since ASR repeats the same words
+FUZZY_CACHE_SIZE = 8192
+
+
+def normalize(text: str) -> str:
+    """Lowercase, unify transliteration variants and squeeze repeated letters"""
+    text = " ".join(text.lower().split())
+    for variant, replacement in TRANSLITERATION_VARIANTS:
+        text = text.replace(variant, replacement)
+    return REPEATED_CHARS.sub(r"\1", text)
+
+
+def max_edits(length: int) -> int:
+    """Edit distance allowed for a normalized query of this length"""
+    if length < MIN_FUZZY_LENGTH:
+        return 0
+    return 1 if length <= 6 else 2
+
+
+def trigrams(text: str) -> set:
+    padded = f"^{text}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def levenshtein(a: str, b: str, limit: int) -> int:
+    """
+    Edit distance between a and b, or limit + 1 if it exceeds `limit`.
+
+    Only the diagonal band of width 2 * limit + 1 is computed, and the
+    scan stops as soon as a whole row is over the limit.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    over = limit + 1
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        low, high = max(1, i - limit), min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        row_min = current[0]
+        char = a[i - 1]
+        for j in range(low, high + 1):
+            cost = previous[j - 1] + (char != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+            if cost < row_min:
+                row_min = cost
+        if row_min > limit:
+            return over
+        previous = current
+    return min(previous[len(b)], over)
+
+
+class FuzzyIndex:
+    """
+    Approximate lookup of noisy words ("tamaatar", "aaloo") in an alias table.
+
+    Aliases are normalized (see normalize()), which alone resolves the
+    common vowel-stretching and spelling variants with one dict read.
+    The rest go through a trigram index: postings are keyed by (trigram,
+    alias length), so a query only reads aliases within its edit budget
+    of its own length. Aliases sharing the most trigrams are then checked
+    with a banded edit distance. Cost depends on the query and the number
+    of near-length aliases sharing its trigrams, not the vocabulary size.
+    """
+
+    # Best trigram-overlap candidates verified with edit distance
+    CANDIDATES = 16
+
+    def __init__(self, aliases: Dict[str, str]):
+        # normalized alias -> (alias as written, value)
+        self.exact: Dict[str, Tuple[str, str]] = {}
+        for alias, value in aliases.items():
+            self.exact.setdefault(normalize(alias), (alias, value))
+        self.keys: List[str] = list(self.exact)
+        postings: Dict[Tuple[str, int], List[int]] = {}
+        for key_id, key in enumerate(self.keys):
+            for gram in trigrams(key):
+                postings.setdefault((gram, len(key)), []).append(key_id)
+        self.postings = {term: np.array(ids, dtype=np.int32) for term, ids in postings.items()}
+        self.cache = LRUCache(maxsize=FUZZY_CACHE_SIZE)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, text: str) -> Optional[Tuple[str, str, float]]:
+        """
+        Closest alias within the edit budget for `text`.
+
+        Returns:
+            (alias, value, confidence) or None. Confidence is 1 minus the
+            edits between text and the alias as written, relative to the
+            longer of the two: 1.0 for an exact match, and a spelling
+            variant that normalizes to the alias counts as one edit.
+        """
+        cached = self.cache.get(text)
+        if cached is None:
+            cached = self._lookup(text) or ()
+            self.cache.put(text, cached)
+        return cached or None
+
+    def _lookup(self, text: str) -> Optional[Tuple[str, str, float]]:
+        query = normalize(text)
+        match = self.exact.get(query)
+        if match is None:
+            limit = max_edits(len(query))
+            if limit == 0:
+                return None
+            grams = trigrams(query)
+            lists = [
+                self.postings[term]
+                for length in range(len(query) - limit, len(query) + limit + 1)
+                for term in ((gram, length) for gram in grams)
+                if term in self.postings
+            ]
+            if not lists:
+                return None
+            # Vectorized: counting postings is the bulk of the work on big vocabularies
+            hits = np.bincount(np.concatenate(lists))
+            # Each edit destroys at most 3 trigrams, so an alias within the
+            # budget shares at least this many
+            candidates = np.flatnonzero(hits >= max(len(grams) - 3 * limit, 1))
+            if len(candidates) > self.CANDIDATES:
+                top = np.argpartition(hits[candidates], -self.CANDIDATES)[-self.CANDIDATES:]
+                candidates = candidates[top]
+            candidates = candidates[np.argsort(-hits[candidates], kind='stable')]
+
+            best = None
+            for key_id in candidates.tolist():
+                key_distance = levenshtein(query, self.keys[key_id], limit)
+                if key_distance <= limit and (best is None or key_distance < best[0]):
+                    best = (key_distance, key_id)
+                    if key_distance == 1:
+                        # Distance 0 was ruled out by the exact lookup
+                        break
+            if best is None:
+                return None
+            normalized_distance, key_id = best
+            match = self.exact[self.keys[key_id]]
+        else:
+            normalized_distance = 0
+
+        alias, value = match
+        heard = " ".join(text.lower().split())
+        distance = 0
+        if heard != alias:
+            # A spelling variant costs one edit, however many letters differ
+            distance = min(levenshtein(heard, alias, len(heard) + len(alias)), normalized_distance + 1)
+        confidence = 1.0 - distance / max(len(heard), len(alias), 1)
+        return alias, value, round(confidence, 3)
@@ -1,28 +1,39 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from voice import router as voice_router
-# from price import router as price_router  # TODO: fix scipy import hang
+from voice import router as voice_router, FUZZY_INDEX
+from price import router as price_router, start_model_loading, model_status_info
 from iot import router as iot_router
 from buyer import router as buyer_router
+from market import router as market_router
+from store import close_store, get_market_stats, get_store_version, normalize_key, sync_listings
+from buyer import feed_cache, listing_feed
+from pricing import price_cache
+from search import search_index
+from metrics import CONTENT_TYPE, MetricsMiddleware, gauge, render_metrics, start_loop_lag_monitor
 
-# Mock price prediction (to replace disabled price router)
-class PricePredictionRequest(BaseModel):
-    crop: str
-    month: int
-
-class PricePredictionResponse(BaseModel):
-    crop: str
-    min_price: float
-    max_price: float
-    predicted_price: float
-    unit: str
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup/shutdown hooks"""
+    # The price model imports sklearn/scipy and unpickles slowly, so load it
+    # in the background and start serving right away
+    start_model_loading()
+    lag_monitor = start_loop_lag_monitor()
+    # Other workers' listing changes reach this worker's SSE clients
+    feed_sync = asyncio.get_running_loop().create_task(listing_feed.follow(sync_listings))
+    yield
+    lag_monitor.cancel()
+    feed_sync.cancel()
+    # Flush group-committed listing writes before the worker exits
+    close_store()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Gaon Bazar API",
     description="Voice-first farmer marketplace with AI-based price prediction",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware for frontend integration
@@ -32,48 +43,87 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Next-After-Id"],
 )
 
+# Per-route request counts, status codes and latency for /metrics
+app.add_middleware(MetricsMiddleware)
+
 # Include routers
 app.include_router(voice_router, prefix="/api", tags=["Voice Input"])
-# app.include_router(price_router, prefix="/api", tags=["Price Prediction"])
+app.include_router(price_router, prefix="/api", tags=["Price Prediction"])
 app.include_router(iot_router, prefix="/api", tags=["IoT Quality Verification"])
 app.include_router(buyer_router, prefix="/api", tags=["Buyer Marketplace"])
+app.include_router(market_router, prefix="/api", tags=["Market Stats"])
 
-# Mock price prediction endpoint
-@app.post("/api/predict-price", response_model=PricePredictionResponse)
-def predict_price(request: PricePredictionRequest):
-    """
-    Mock price prediction. Returns realistic price ranges for common crops.
-    In production, this would use the ML model.
-    """
-    # Simple mock prices based on crop type
-    price_map = {
-        "wheat": {"min": 20, "max": 25, "predicted": 22},
-        "rice": {"min": 35, "max": 45, "predicted": 40},
-        "tomato": {"min": 10, "max": 20, "predicted": 15},
-        "onion": {"min": 15, "max": 25, "predicted": 20},
-        "potato": {"min": 12, "max": 18, "predicted": 15},
-        "carrot": {"min": 15, "max": 25, "predicted": 20},
-        "cauliflower": {"min": 20, "max": 35, "predicted": 27},
-        "cabbage": {"min": 10, "max": 18, "predicted": 14},
-        "brinjal": {"min": 15, "max": 25, "predicted": 20},
-        "garlic": {"min": 80, "max": 120, "predicted": 100},
-        "apple": {"min": 50, "max": 80, "predicted": 65},
-        "banana": {"min": 20, "max": 35, "predicted": 27},
-        "mango": {"min": 40, "max": 70, "predicted": 55},
-    }
-    
-    crop_lower = request.crop.lower()
-    prices = price_map.get(crop_lower, {"min": 20, "max": 30, "predicted": 25})
-    
-    return PricePredictionResponse(
-        crop=request.crop,
-        min_price=prices["min"],
-        max_price=prices["max"],
-        predicted_price=prices["predicted"],
-        unit="₹/kg"
-    )
+# Scrape-time metrics: read from existing state, so serving pays nothing
+CACHES = {
+    "buyer_pages": feed_cache,
+    "price_ranges": price_cache,
+    "fuzzy_crops": FUZZY_INDEX.cache,
+}
+
+@gauge("gaon_store_listings", "Listings in the store by status")
+def store_listings():
+    totals = get_market_stats()
+    return [
+        ({"status": "available"}, totals["available_listings"]),
+        ({"status": "sold"}, totals["sold_listings"]),
+    ]
+
+@gauge("gaon_store_available_quantity_kg", "Kilos available across all listings")
+def store_available_quantity():
+    return get_market_stats()["available_quantity"]
+
+@gauge("gaon_store_version", "Store version (increments on every listing change)")
+def store_version():
+    return get_store_version()[0]
+
+@gauge("gaon_cache_entries", "Entries held by each cache")
+def cache_entries():
+    sizes = [({"cache": name}, len(cache)) for name, cache in CACHES.items()]
+    sizes.append(({"cache": "normalize_key"}, normalize_key.cache_info().currsize))
+    return sizes
+
+@gauge("gaon_cache_hits_total", "Cache hits", kind="counter")
+def cache_hits():
+    hits = [({"cache": name}, cache.hits) for name, cache in CACHES.items()]
+    hits.append(({"cache": "normalize_key"}, normalize_key.cache_info().hits))
+    return hits
+
+@gauge("gaon_cache_misses_total", "Cache misses", kind="counter")
+def cache_misses():
+    misses = [({"cache": name}, cache.misses) for name, cache in CACHES.items()]
+    misses.append(({"cache": "normalize_key"}, normalize_key.cache_info().misses))
+    return misses
+
+@gauge("gaon_cache_hit_ratio", "Cache hits / lookups since startup")
+def cache_hit_ratio():
+    counts = {name: (cache.hits, cache.misses) for name, cache in CACHES.items()}
+    info = normalize_key.cache_info()
+    counts["normalize_key"] = (info.hits, info.misses)
+    return [
+        ({"cache": name}, hits / (hits + misses))
+        for name, (hits, misses) in counts.items()
+        if hits + misses
+    ]
+
+@gauge("gaon_search_indexed_listings", "Listings in the search index")
+def search_indexed_listings():
+    return len(search_index.terms_by_id)
+
+@gauge("gaon_feed_subscribers", "Clients connected to /api/buyer/listings/stream")
+def feed_subscribers():
+    return len(listing_feed.subscribers)
+
+@gauge("gaon_price_model_ready", "1 once the price model is loaded")
+def price_model_ready():
+    return 1 if model_status_info()["ready"] else 0
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics (text exposition format)"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
 
 # Root endpoint
 @app.get("/")
@@ -89,8 +139,8 @@ def read_root():
 # Health check endpoint
 @app.get("/health")
 def health_check():
-    """Health check endpoint"""
-    return {"status": "ok"}
+    """Health check endpoint, including price model readiness"""
+    return {"status": "ok", "price_model": model_status_info()}
 
 if __name__ == "__main__":
     import uvicorn
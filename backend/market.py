@@ -0,0 +1,55 @@
+from fastapi import APIRouter
+from pydantic import BaseModel
+from typing import Dict, Optional
+from store import get_market_stats
+
+router = APIRouter()
+
+class MarketAggregate(BaseModel):
+    listings: int
+    total_quantity: int
+    available_listings: int
+    available_quantity: int
+    sold_listings: int
+    sold_quantity: int
+
+class MarketStats(BaseModel):
+    totals: MarketAggregate
+    crop: Optional[MarketAggregate] = None
+    location: Optional[MarketAggregate] = None
+    by_crop: Optional[Dict[str, MarketAggregate]] = None
+    by_location: Optional[Dict[str, MarketAggregate]] = None
+
+@router.get("/market/stats", response_model=MarketStats)
+async def market_stats(
+    crop: Optional[str] = None,
+    location: Optional[str] = None,
+    by_crop: bool = False,
+    by_location: bool = False
+):
+    """
+    Get marketplace aggregates: listing count, total quantity and
+    available vs. sold, maintained incrementally by the store.
+
+    Args:
+        crop: Also return the aggregate for this crop
+        location: Also return the aggregate for this location
+        by_crop: Also return a breakdown for every crop
+        by_location: Also return a breakdown for every location
+
+    Example:
+    GET /market/stats?crop=tomato
+
+    Response:
+    {
+      "totals": {"listings": 3, "total_quantity": 180, "available_listings": 2, ...},
+      "crop": {"listings": 2, "total_quantity": 150, "available_listings": 1, ...}
+    }
+    """
+    return MarketStats(
+        totals=get_market_stats(),
+        crop=get_market_stats("crop", crop) if crop else None,
+        location=get_market_stats("location", location) if location else None,
+        by_crop=get_market_stats("crop") if by_crop else None,
+        by_location=get_market_stats("location") if by_location else None
+    )
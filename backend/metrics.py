@@ -0,0 +1,287 @@
+import asyncio
+import re
+from abc import ABC, abstractmethod
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Latency buckets in seconds (upper bounds; +Inf is implicit)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# How often the event loop lag probe wakes up
+LOOP_LAG_INTERVAL = 0.5
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Labels, float]
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric(ABC):
+    """Base for metrics rendered in Prometheus text exposition format"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+
+    def key(self, label_values: Tuple) -> Labels:
+        return tuple(zip(self.label_names, label_values))
+
+    @abstractmethod
+    def samples(self) -> List[Sample]:
+        """Current (name, labels, value) samples of this metric"""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """
+    Monotonic counter per label set.
+
+    inc() is a dict update without a lock: counters are only incremented
+    from the event loop thread, where updates can't interleave.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = ()):
+        super().__init__(name, help_text, label_names)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, self.key(labels), value) for labels, value in list(self.values.items())]
+
+
+class Histogram(Metric):
+    """
+    Cumulative histogram per label set.
+
+    Each observation is a bisect and three additions under a lock that is
+    only contended when observing from several threads at once.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, label_names: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self.series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            snapshot = [(labels, list(counts), total) for labels, (counts, total) in self.series.items()]
+        samples = []
+        for label_values, counts, total in snapshot:
+            labels = self.key(label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", labels + (("le", format_value(bound)),), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class CallbackGauge(Metric):
+    """Gauge whose samples are read at scrape time, so hot paths pay nothing"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], Iterable[Tuple[Labels, float]]],
+                 kind: str = "gauge"):
+        super().__init__(name, help_text)
+        self.read = read
+        self.kind = kind
+
+    def samples(self) -> List[Sample]:
+        return [(self.name, labels, value) for labels, value in self.read()]
+
+
+registry: List[Metric] = []
+
+
+def register(metric: Metric) -> Metric:
+    registry.append(metric)
+    return metric
+
+
+def gauge(name: str, help_text: str, kind: str = "gauge"):
+    """
+    Register a function as a scrape-time gauge (or counter, via `kind`).
+    It returns a number, or an iterable of (labels dict, number).
+    """
+    def decorator(read: Callable):
+        def samples():
+            value = read()
+            if isinstance(value, (int, float)):
+                return [((), value)]
+            return [(tuple(labels.items()), v) for labels, v in value]
+        register(CallbackGauge(name, help_text, samples, kind=kind))
+        return read
+    return decorator
+
+
+def render_metrics() -> str:
+    """All registered metrics in Prometheus text format"""
+    lines = []
+    for metric in registry:
+        try:
+            lines.extend(metric.render())
+        except Exception as e:
+            # One broken collector shouldn't take down the scrape
+            lines.append(f"# {metric.name} unavailable: {str(e)}")
+    return "\n".join(lines) + "\n"
+
+
+# HTTP metrics
+http_requests = register(Counter(
+    "gaon_http_requests_total", "HTTP requests by method, route template and status",
+    ("method", "route", "status")
+))
+http_latency = register(Histogram(
+    "gaon_http_request_duration_seconds", "HTTP request latency by method and route template",
+    ("method", "route")
+))
+http_in_flight = {"value": 0}
+register(CallbackGauge(
+    "gaon_http_requests_in_flight", "HTTP requests currently being served",
+    lambda: [((), http_in_flight["value"])]
+))
+
+
+_static_labels: Dict[Tuple[str, str], str] = {}
+
+
+def route_label(scope: Dict) -> str:
+    """Route template (e.g. /api/buyer/listings/{id}), never the raw path"""
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    params = scope.get("path_params")
+    if not params:
+        # Without parameters the path is fixed per route, so memoize
+        key = (template, scope["path"])
+        label = _static_labels.get(key)
+        if label is None:
+            label = _static_labels[key] = _label_for(template, scope["path"], {})
+        return label
+    return _label_for(template, scope["path"], params)
+
+
+def _label_for(template: str, path: str, params: Dict) -> str:
+    # Routes of included routers may not carry the router prefix; recover
+    # it from the request path, which ends with the filled-in template
+    concrete = template
+    for name, value in params.items():
+        concrete = re.sub(r"\{" + re.escape(name) + r"(:[^}]*)?\}", lambda _: str(value), concrete)
+    if path != concrete and path.endswith(concrete):
+        return path[:-len(concrete)] + template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request count, status and latency per route.
+
+    Plain ASGI rather than BaseHTTPMiddleware: it doesn't wrap requests in
+    extra tasks or buffer streaming responses. For streams (SSE) the
+    latency is the time until the stream ends.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        http_in_flight["value"] += 1
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_in_flight["value"] -= 1
+            route = route_label(scope)
+            method = scope["method"]
+            http_latency.observe(time.perf_counter() - started, method, route)
+            http_requests.inc(method, route, str(status))
+
+
+# Event loop lag
+loop_lag = register(Histogram(
+    "gaon_event_loop_lag_seconds", "How late the event loop ran a timer scheduled every "
+    f"{LOOP_LAG_INTERVAL}s (time it was blocked)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+))
+loop_lag_last = {"value": 0.0}
+register(CallbackGauge(
+    "gaon_event_loop_lag_last_seconds", "Event loop lag at the latest probe",
+    lambda: [((), loop_lag_last["value"])]
+))
+
+
+async def monitor_event_loop_lag(interval: float = LOOP_LAG_INTERVAL):
+    """Probe task: sleep `interval` and record how late the wakeup was"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - expected)
+        loop_lag_last["value"] = lag
+        loop_lag.observe(lag)
+
+
+def start_loop_lag_monitor() -> Optional[asyncio.Task]:
+    """Start the lag probe on the running loop (call from startup)"""
+    return asyncio.get_running_loop().create_task(monitor_event_loop_lag())
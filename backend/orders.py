@@ -0,0 +1,238 @@
+import heapq
+import math
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from store import (
+    add_store_listener,
+    adjust_listing_quantity,
+    get_all_listings,
+    get_listing_by_id,
+    normalize_key,
+    sync_listings,
+)
+
+
+# Planning rounds for a partial fill whose reservations keep conflicting
+MATCH_ATTEMPTS = 3
+
+# Queued changes after which the store listener applies them itself, so
+# books of crops that never get an order don't grow without limit
+PENDING_DRAIN_THRESHOLD = 64
+
+
+class InsufficientQuantityError(Exception):
+    """Not enough available quantity to fill an order"""
+
+    def __init__(self, crop: str, requested: int, available: int):
+        super().__init__(f"Only {available} kg of {crop} available, {requested} kg requested")
+        self.crop = crop
+        self.requested = requested
+        self.available = available
+
+
+def book_key(listing: Dict) -> Tuple[float, int]:
+    """
+    Priority of a listing in its crop's book: cheapest asking price first,
+    then oldest. Listings without an asking price queue after priced ones.
+    """
+    price = listing.get("price")
+    return (price if price is not None else math.inf, listing["id"])
+
+
+class CropBook:
+    """Heap of available listings for one crop, with its own lock and change queue"""
+
+    __slots__ = ("heap", "entries", "pending", "lock")
+
+    def __init__(self):
+        self.heap: List[Tuple[float, int]] = []
+        self.entries: Dict[int, Tuple[float, int]] = {}
+        self.pending: deque = deque()
+        self.lock = threading.Lock()
+
+    def track(self, listing: Dict):
+        listing_id = listing["id"]
+        if listing["status"] != "available" or listing["quantity"] <= 0:
+            self.entries.pop(listing_id, None)
+            return
+        key = book_key(listing)
+        if self.entries.get(listing_id) != key:
+            self.entries[listing_id] = key
+            heapq.heappush(self.heap, key)
+
+    def drain(self):
+        """Apply queued store changes (caller holds self.lock)"""
+        while self.pending:
+            event, listing_id = self.pending.popleft()
+            listing = get_listing_by_id(listing_id) if event != "removed" else None
+            if listing is None:
+                self.entries.pop(listing_id, None)
+            else:
+                self.track(listing)
+        # Drop dead heap entries (sold, removed or repriced listings) once
+        # they outnumber the live ones
+        if len(self.heap) > 2 * len(self.entries) + PENDING_DRAIN_THRESHOLD:
+            # In place: match() holds a reference to the list
+            self.heap[:] = self.entries.values()
+            heapq.heapify(self.heap)
+
+
+class OrderBook:
+    """
+    Per-crop books of available listings for matching buyer orders.
+
+    Each CropBook is a heap of (price, id) entries. Entries are invalidated
+    lazily: `entries` holds the current key of every live listing and a
+    popped entry that doesn't match it is simply dropped, so adds, price
+    changes and removals are O(log n) and matching never rescans.
+
+    Store changes arrive through a listener that only appends to the crop's
+    queue; the book applies them at the start of every match, under its
+    own lock, or once PENDING_DRAIN_THRESHOLD changes are queued. The
+    listener never waits for a book lock (it only drains if the lock is
+    free), so the store lock and book locks can't deadlock.
+
+    Matching is serialized per crop by the book lock; reserving each
+    listing goes through ListingStore.adjust_quantity, which checks and
+    decrements atomically per listing (across workers with the shared
+    engine), so concurrent buyers can never double-allocate.
+    """
+
+    def __init__(self):
+        self.books: Dict[str, CropBook] = {}
+        self._guard = threading.Lock()
+
+    def _book(self, crop_key: str) -> CropBook:
+        book = self.books.get(crop_key)
+        if book is None:
+            with self._guard:
+                book = self.books.setdefault(crop_key, CropBook())
+        return book
+
+    def on_store_event(self, event: str, listing: Optional[Dict]):
+        """Store listener: queue the change for the crop's next match"""
+        if event == "cleared":
+            self.books = {}
+        else:
+            book = self._book(normalize_key(listing["crop"]))
+            book.pending.append((event, listing["id"]))
+            # Never waits for the book lock, so listener and match can't deadlock
+            if len(book.pending) > PENDING_DRAIN_THRESHOLD and book.lock.acquire(blocking=False):
+                try:
+                    book.drain()
+                finally:
+                    book.lock.release()
+
+    def match(self, crop: str, quantity: int, allow_partial: bool = False) -> List[Dict]:
+        """
+        Fill an order from the cheapest, oldest available listings of a crop,
+        splitting it across as many listings as needed.
+
+        Args:
+            crop: Crop name
+            quantity: Kilos to buy
+            allow_partial: Fill as much as is available instead of failing,
+                           including when other buyers take listings
+                           while the order is being reserved
+
+        Returns:
+            Allocations: [{"listing_id", "quantity", "price", "location"}]
+
+        Raises:
+            InsufficientQuantityError: Not enough available and not allow_partial
+        """
+        sync_listings()
+        book = self._book(normalize_key(crop))
+        with book.lock:
+            book.drain()
+            heap = book.heap
+
+            # listing ID -> [updated listing, kilos reserved], in reservation order
+            reserved: Dict[int, list] = {}
+            remaining = quantity
+            for _ in range(MATCH_ATTEMPTS):
+                # Pop entries until the order is covered, dropping stale ones
+                plan: List[Tuple[Tuple[float, int], Dict, int]] = []
+                planned = set()
+                short = remaining
+                while heap and short > 0:
+                    key = heapq.heappop(heap)
+                    listing_id = key[1]
+                    if book.entries.get(listing_id) != key or listing_id in planned:
+                        continue
+                    listing = get_listing_by_id(listing_id)
+                    if listing is None or listing["status"] != "available" or listing["quantity"] <= 0:
+                        book.entries.pop(listing_id, None)
+                        continue
+                    take = min(short, listing["quantity"])
+                    plan.append((key, listing, take))
+                    planned.add(listing_id)
+                    short -= take
+
+                if short > 0 and not allow_partial:
+                    for key, _, _ in plan:
+                        heapq.heappush(heap, key)
+                    raise InsufficientQuantityError(crop, quantity, quantity - short)
+
+                # Reserve each listing atomically. On a conflict (another
+                # buyer got there first) a full order is undone; a partial
+                # one keeps what it got and re-plans on the listings' new state
+                conflict = False
+                for key, listing, take in plan:
+                    updated = adjust_listing_quantity(listing["id"], -take)
+                    if updated is not None:
+                        entry = reserved.setdefault(listing["id"], [updated, 0])
+                        entry[0] = updated
+                        entry[1] += take
+                        remaining -= take
+                        # Quantity left goes back into the book
+                        if updated["quantity"] > 0 and updated["status"] == "available":
+                            heapq.heappush(heap, key)
+                        continue
+                    if not allow_partial:
+                        # Entries not already pushed back (sold out, or not reserved)
+                        for key, planned_listing, _ in plan:
+                            done = reserved.get(planned_listing["id"])
+                            if done is None or done[0]["quantity"] == 0:
+                                heapq.heappush(heap, key)
+                        for done, amount in reserved.values():
+                            adjust_listing_quantity(done["id"], amount)
+                        book.drain()
+                        planned_quantity = sum(amount for _, _, amount in plan)
+                        raise InsufficientQuantityError(crop, quantity, planned_quantity - take)
+                    heapq.heappush(heap, key)
+                    conflict = True
+                book.drain()
+                if not conflict or remaining == 0:
+                    break
+
+            return [
+                {
+                    "listing_id": listing["id"],
+                    "quantity": take,
+                    "price": listing.get("price"),
+                    "location": listing.get("location", "Village X")
+                }
+                for listing, take in reserved.values()
+            ]
+
+
+order_book = OrderBook()
+for _listing in get_all_listings():
+    order_book.on_store_event("added", _listing)
+add_store_listener(order_book.on_store_event)
+
+def match_order(crop: str, quantity: int, allow_partial: bool = False) -> List[Dict]:
+    """
+    Match and reserve an order against available listings.
+
+    Args:
+        crop: Crop name
+        quantity: Kilos to buy
+        allow_partial: Accept a partial fill
+
+    Returns:
+        List of allocations (see OrderBook.match)
+    """
+    return order_book.match(crop, quantity, allow_partial=allow_partial)
@@ -0,0 +1,462 @@
+"""
+Durable engines for the listing store.
+
+Both engines expose the same small interface used by store.ListingStore:
+
+    load()          -> (counter, listings)   called once at startup
+    append(record, expected=None)             called for every mutation
+    flush()                                   force pending writes to disk
+    close()                                   flush and release resources
+
+SharedSQLiteEngine additionally provides next_id(name) and changes() for
+multi-process deployments (see its docstring).
+
+Records are plain dicts: {"op": "add" | "update", "listing": {...}},
+{"op": "delete", "id": n} or {"op": "clear"}. {"op": "batch", "records":
+[...]} groups several records that must be applied together: engines
+write it as one log line or one transaction.
+
+Writes are group-committed: append() only buffers the record, and a
+background thread flushes + fsyncs everything buffered every
+`sync_interval` seconds. A crash can therefore lose at most the last
+`sync_interval` worth of acknowledged writes, in exchange for write
+throughput that doesn't pay an fsync per listing.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_SYNC_INTERVAL = 0.05       # seconds between group commits
+DEFAULT_SEGMENT_RECORDS = 100_000  # log records per segment before compaction
+
+
+class StaleWriteError(Exception):
+    """A conditional write found the listing changed by another worker"""
+
+
+def apply_record(listings: Dict[int, Dict], counter: int, record: Dict) -> int:
+    """
+    Apply one log record to a listings map.
+
+    Returns:
+        The ID counter after the record
+    """
+    op = record["op"]
+    if op in ("add", "update"):
+        listing = record["listing"]
+        listings[listing["id"]] = listing
+        counter = max(counter, listing["id"])
+    elif op == "delete":
+        listings.pop(record["id"], None)
+    elif op == "clear":
+        listings.clear()
+        counter = 0
+    elif op == "batch":
+        for sub_record in record["records"]:
+            counter = apply_record(listings, counter, sub_record)
+    return counter
+
+
+class _GroupCommitter:
+    """Background thread that calls `commit` every `interval` seconds"""
+
+    def __init__(self, commit, interval: float):
+        self._commit = commit
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="store-group-commit", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self._interval):
+            try:
+                self._commit()
+            except Exception as e:
+                print(f"[ERROR] Store group commit failed: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+class LogEngine:
+    """
+    Append-only log + snapshot engine.
+
+    The log is split into segment files `log-<first seq>.jsonl`. When the
+    active segment reaches `segment_records` records it is closed and a
+    background compaction folds the previous snapshot and all closed
+    segments into a new `snapshot.json` (written to a temp file, fsynced and
+    atomically renamed), then deletes those segments. Compaction only reads
+    files, never the live store, so it doesn't block request handling.
+
+    Recovery loads the snapshot and replays the (short) log tail.
+    """
+
+    SNAPSHOT_FILE = "snapshot.json"
+
+    def __init__(self, directory: str, sync_interval: float = DEFAULT_SYNC_INTERVAL,
+                 segment_records: int = DEFAULT_SEGMENT_RECORDS):
+        self.directory = directory
+        self.sync_interval = sync_interval
+        self.segment_records = segment_records
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._file = None
+        self._segment_count = 0
+        self._dirty = False
+        self._committer: Optional[_GroupCommitter] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_path(self, first_seq: int) -> str:
+        return os.path.join(self.directory, f"log-{first_seq:012d}.jsonl")
+
+    def _segments(self) -> List[Tuple[int, str]]:
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith("log-") and name.endswith(".jsonl"):
+                segments.append((int(name[4:-6]), os.path.join(self.directory, name)))
+        return sorted(segments)
+
+    def _read_snapshot(self) -> Tuple[int, int, Dict[int, Dict]]:
+        path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+        if not os.path.exists(path):
+            return 0, 0, {}
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+        listings = {listing["id"]: listing for listing in snapshot["listings"]}
+        return snapshot["seq"], snapshot["counter"], listings
+
+    @staticmethod
+    def _replay(path: str, after_seq: int, listings: Dict[int, Dict], counter: int) -> Tuple[int, int]:
+        last_seq = after_seq
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the tail of a segment: everything after it is lost
+                    break
+                if record["seq"] <= after_seq:
+                    continue
+                counter = apply_record(listings, counter, record)
+                last_seq = record["seq"]
+        return last_seq, counter
+
+    def load(self) -> Tuple[int, List[Dict]]:
+        seq, counter, listings = self._read_snapshot()
+        for _, path in self._segments():
+            seq, counter = self._replay(path, seq, listings, counter)
+
+        self.seq = seq
+        # Always start a fresh segment so a torn tail never gets appended to.
+        # A leftover file with this name can only hold an unreplayable torn record.
+        self._file = open(self._segment_path(seq + 1), "w", encoding="utf-8")
+        self._segment_count = 0
+        self._committer = _GroupCommitter(self.flush, self.sync_interval)
+        print(f"[OK] Listing store recovered {len(listings):,} listings from {self.directory} (seq {seq})")
+        return counter, list(listings.values())
+
+    def append(self, record: Dict, expected: Optional[Dict] = None):
+        # Single-process engine: the store lock already makes `expected` hold
+        with self._lock:
+            self.seq += 1
+            record = dict(record, seq=self.seq)
+            self._file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self._dirty = True
+            self._segment_count += 1
+            rotate = self._segment_count >= self.segment_records
+            if rotate:
+                self._rotate()
+        if rotate:
+            threading.Thread(target=self.compact, name="store-compaction", daemon=True).start()
+
+    def _rotate(self):
+        # Caller holds self._lock
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._file = open(self._segment_path(self.seq + 1), "a", encoding="utf-8")
+        self._segment_count = 0
+        self._dirty = False
+
+    def flush(self):
+        with self._lock:
+            if not self._dirty or self._file is None:
+                return
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._dirty = False
+
+    def compact(self):
+        """Fold the snapshot and all closed segments into a new snapshot"""
+        with self._compact_lock:
+            with self._lock:
+                active = self._file.name if self._file else None
+                closed = [(first, path) for first, path in self._segments() if path != active]
+            if not closed:
+                return
+
+            seq, counter, listings = self._read_snapshot()
+            for _, path in closed:
+                seq, counter = self._replay(path, seq, listings, counter)
+
+            final_path = os.path.join(self.directory, self.SNAPSHOT_FILE)
+            tmp_path = final_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"seq": seq, "counter": counter, "listings": list(listings.values())},
+                          f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, final_path)
+
+            for _, path in closed:
+                os.remove(path)
+            print(f"[INFO] Listing store compacted {len(closed)} log segment(s) into snapshot (seq {seq})")
+
+    def close(self):
+        if self._committer is not None:
+            self._committer.stop()
+            self._committer = None
+        self.flush()
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SQLiteEngine:
+    """
+    SQLite engine in WAL mode.
+
+    Each listing is one row holding its JSON document. Mutations are
+    executed immediately inside an open transaction, and the group
+    committer issues one COMMIT for everything buffered per interval.
+    """
+
+    def __init__(self, path: str, sync_interval: float = DEFAULT_SYNC_INTERVAL):
+        self.path = path
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._in_transaction = False
+        self._committer: Optional[_GroupCommitter] = None
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS listings (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def load(self) -> Tuple[int, List[Dict]]:
+        listings = [json.loads(data) for (data,) in self._conn.execute("SELECT data FROM listings ORDER BY id")]
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'counter'").fetchone()
+        counter = row[0] if row else 0
+        self._committer = _GroupCommitter(self.flush, self.sync_interval)
+        print(f"[OK] Listing store recovered {len(listings):,} listings from {self.path}")
+        return counter, listings
+
+    def _write(self, record: Dict):
+        # Caller holds self._lock inside an open transaction
+        op = record["op"]
+        if op in ("add", "update"):
+            listing = record["listing"]
+            self._conn.execute("INSERT OR REPLACE INTO listings (id, data) VALUES (?, ?)",
+                               (listing["id"], json.dumps(listing, separators=(",", ":"))))
+            if op == "add":
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('counter', ?)",
+                                   (listing["id"],))
+        elif op == "delete":
+            self._conn.execute("DELETE FROM listings WHERE id = ?", (record["id"],))
+        elif op == "clear":
+            self._conn.execute("DELETE FROM listings")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('counter', 0)")
+        elif op == "batch":
+            for sub_record in record["records"]:
+                self._write(sub_record)
+
+    def append(self, record: Dict, expected: Optional[Dict] = None):
+        # Single-process engine: the store lock already makes `expected` hold
+        with self._lock:
+            if not self._in_transaction:
+                self._conn.execute("BEGIN")
+                self._in_transaction = True
+            self._write(record)
+
+    def flush(self):
+        with self._lock:
+            if self._in_transaction:
+                self._conn.execute("COMMIT")
+                self._in_transaction = False
+
+    def close(self):
+        if self._committer is not None:
+            self._committer.stop()
+            self._committer = None
+        self.flush()
+        self._conn.close()
+
+
+class SharedSQLiteEngine(SQLiteEngine):
+    """
+    SQLite engine shared by several worker processes (uvicorn --workers N).
+
+    Unlike the other engines this one is the source of truth rather than a
+    backup, so ListingStore writes through it first (see ListingStore.sync):
+
+    - IDs come from a `counters` table, incremented inside an IMMEDIATE
+      transaction, so allocation is atomic across processes.
+    - Every mutation commits the listing row and a row in a `changes` feed
+      in one transaction. Each worker replays the feed past its last seen
+      sequence number, which keeps every worker's indexes identical and in
+      commit order. `PRAGMA data_version` makes the "nothing changed" check
+      nearly free.
+    - The feed is pruned to its last CHANGES_KEPT entries; a worker that
+      falls further behind reloads the full state instead.
+
+    Commits are per-write (no group commit) so other workers see them
+    immediately; WAL with synchronous=NORMAL keeps them cheap.
+    """
+
+    shared = True
+    CHANGES_KEPT = 100_000
+    PRUNE_EVERY = 1_000
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, record TEXT NOT NULL)")
+        self.last_seq = 0
+        self._data_version = None
+        self._own_writes = False
+        self._appends = 0
+
+    def _data_version_now(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load(self) -> Tuple[int, List[Dict]]:
+        with self._lock:
+            # One read transaction so listings and the feed position agree
+            self._conn.execute("BEGIN")
+            try:
+                listings = [json.loads(data) for (data,) in self._conn.execute("SELECT data FROM listings ORDER BY id")]
+                row = self._conn.execute("SELECT value FROM counters WHERE name = 'listing'").fetchone()
+                counter = row[0] if row else 0
+                row = self._conn.execute("SELECT MAX(seq) FROM changes").fetchone()
+                self.last_seq = row[0] or 0
+                self._data_version = self._data_version_now()
+            finally:
+                self._conn.execute("COMMIT")
+            self._own_writes = False
+        print(f"[OK] Shared listing store loaded {len(listings):,} listings from {self.path}")
+        return counter, listings
+
+    def next_id(self, name: str, count: int = 1) -> int:
+        """Reserve `count` consecutive IDs and return the first"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)", (name,))
+                self._conn.execute("UPDATE counters SET value = value + ? WHERE name = ?", (count, name))
+                value = self._conn.execute("SELECT value FROM counters WHERE name = ?", (name,)).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return value - count + 1
+
+    def append(self, record: Dict, expected: Optional[Dict] = None):
+        """
+        Commit a record and its change-feed entry in one transaction.
+
+        Args:
+            record: Mutation record
+            expected: Optional listing fields that must still have these
+                values in the database (checked under the write lock);
+                raises StaleWriteError otherwise
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if expected is not None:
+                    row = self._conn.execute("SELECT data FROM listings WHERE id = ?",
+                                             (record["listing"]["id"],)).fetchone()
+                    current = json.loads(row[0]) if row else {}
+                    if any(current.get(field) != value for field, value in expected.items()):
+                        raise StaleWriteError(f"Listing {record['listing']['id']} changed concurrently")
+                self._write(record)
+                if record["op"] == "clear":
+                    self._conn.execute("INSERT OR REPLACE INTO counters (name, value) VALUES ('listing', 0)")
+                cursor = self._conn.execute("INSERT INTO changes (record) VALUES (?)",
+                                            (json.dumps(record, separators=(",", ":")),))
+                self._appends += 1
+                if self._appends % self.PRUNE_EVERY == 0:
+                    self._conn.execute("DELETE FROM changes WHERE seq <= ?",
+                                       (cursor.lastrowid - self.CHANGES_KEPT,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._own_writes = True
+
+    def changes(self) -> Optional[List[Dict]]:
+        """
+        Records committed (by any worker) since the last call, in commit order.
+
+        Returns:
+            List of records, or None if the feed was pruned past this
+            worker's position and the caller must load() again
+        """
+        with self._lock:
+            version = self._data_version_now()
+            if version == self._data_version and not self._own_writes:
+                return []
+            rows = self._conn.execute("SELECT seq, record FROM changes WHERE seq > ? ORDER BY seq",
+                                      (self.last_seq,)).fetchall()
+            if rows and rows[0][0] != self.last_seq + 1:
+                first_kept = self._conn.execute("SELECT MIN(seq) FROM changes").fetchone()[0]
+                if first_kept > self.last_seq + 1:
+                    return None
+            self._data_version = version
+            self._own_writes = False
+            if rows:
+                self.last_seq = rows[-1][0]
+            return [json.loads(record) for _, record in rows]
+
+    def flush(self):
+        # Every write is already committed
+        pass
+
+    def close(self):
+        self._conn.close()
+
+
+def engine_from_env():
+    """
+    Build the engine selected by GAON_STORE_ENGINE ("memory", "log",
+    "sqlite" or "shared"; default "memory") with its files under
+    GAON_STORE_PATH. Use "shared" when running several uvicorn workers.
+
+    Returns:
+        An engine instance, or None for the plain in-memory store
+    """
+    kind = os.environ.get("GAON_STORE_ENGINE", "memory").lower()
+    default_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'listings')
+    path = os.environ.get("GAON_STORE_PATH", default_path)
+    sync_interval = float(os.environ.get("GAON_STORE_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL))
+
+    if kind == "memory":
+        return None
+    if kind == "log":
+        return LogEngine(path, sync_interval=sync_interval)
+    if kind in ("sqlite", "shared"):
+        if not path.endswith(".db"):
+            path = os.path.join(path, "listings.db")
+        if kind == "shared":
+            return SharedSQLiteEngine(path)
+        return SQLiteEngine(path, sync_interval=sync_interval)
+    raise ValueError(f"Unknown GAON_STORE_ENGINE: {kind}. Use memory, log, sqlite or shared.")
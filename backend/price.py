@@ -1,6 +1,18 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, Header, HTTPException, Response
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from pricing import table_price_ranges, set_price_predictor
+from metrics import Histogram, register
+import asyncio
+import json
 import pickle
+import secrets
+import struct
+import threading
+import time
+import zipfile
 import numpy as np
 import os
 
@@ -18,31 +30,596 @@ class PricePredictionOutput(BaseModel):
     predicted_price: float
     currency: str = "INR"
     unit: str = "kg"  # User-friendly unit
+    source: str = "model"  # "mock" while the model is loading
 
-# Load model
-model_path = os.path.join(os.path.dirname(__file__), '..', 'ml', 'price_model.pkl')
+# Most queries accepted by one /predict-price/batch request
+MAX_BATCH_SIZE = 5000
+
+class BatchPriceQuery(BaseModel):
+    crop: str
+    month: int
+    market: Optional[str] = None
+
+class BatchPricePredictionInput(BaseModel):
+    queries: List[BatchPriceQuery] = Field(..., max_length=MAX_BATCH_SIZE)
+
+class BatchPriceResult(BaseModel):
+    crop: str
+    month: int
+    market: Optional[str] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    predicted_price: Optional[float] = None
+    error: Optional[str] = None
+
+class BatchPricePredictionOutput(BaseModel):
+    results: List[BatchPriceResult]
+    currency: str = "INR"
+    unit: str = "kg"
+
+# Price spread around the prediction, and floors for sensible prices (₹/kg)
+PRICE_VARIATION = 0.15
+MIN_PRICE_FLOOR = 1.0
+MAX_PRICE_FLOOR = 2.0
+PREDICTED_PRICE_FLOOR = 1.5
+
+MONTHS = 12
+
+
+class PriceTable:
+    """
+    Every prediction of a (crop, month, market) model, precomputed.
+
+    The model's input domain is small and finite, so instead of running
+    the label encoders and model.predict per request, all
+    crops x 12 months x markets predictions are made in one predict call
+    and stored in a dense array (already converted to ₹/kg). A lookup is
+    then two dict reads and an array index.
+    """
+
+    def __init__(self, model, crops: List[str], markets: List[str], price_unit: str = 'quintal'):
+        # LabelEncoder codes are positions in classes_. Incremental updates
+        # (ml/update_model.py) append new classes, so it may not be sorted.
+        self.crop_index = {crop: i for i, crop in enumerate(crops)}
+        self.market_index = {market: i for i, market in enumerate(markets)}
+        self.crops = np.array(crops)
+        self.markets = np.array(markets)
+        self.crop_order = np.argsort(self.crops, kind='stable')
+        self.market_order = np.argsort(self.markets, kind='stable')
+
+        crop_codes, months, market_codes = np.meshgrid(
+            np.arange(len(crops)),
+            np.arange(1, MONTHS + 1),
+            np.arange(len(markets)),
+            indexing='ij'
+        )
+        features = np.column_stack([crop_codes.ravel(), months.ravel(), market_codes.ravel()])
+        predictions = np.asarray(model.predict(features), dtype=np.float64)
+
+        # Convert from quintal (100kg) to per kg for user-friendly display
+        if price_unit == 'quintal':
+            predictions = predictions / 100
+        self.prices = predictions.reshape(len(crops), MONTHS, len(markets))
+
+    def lookup(self, crop: str, month: int, market: str) -> float:
+        """
+        Predicted price in ₹/kg.
+
+        Raises:
+            KeyError: Crop or market unknown to the model
+        """
+        return float(self.prices[self.crop_index[crop], month - 1, self.market_index[market]])
+
+    @staticmethod
+    def encode(classes: np.ndarray, names: List[str], order: np.ndarray) -> np.ndarray:
+        """
+        Vectorized LabelEncoder.transform that marks unknown names with -1
+        instead of raising (a binary search over classes in `order`, the
+        argsort of classes).
+        """
+        values = np.array(names, dtype=classes.dtype if len(names) == 0 else None)
+        if len(classes) == 0:
+            return np.full(len(values), -1)
+        positions = np.searchsorted(classes, values, sorter=order)
+        positions[positions == len(classes)] = 0
+        codes = order[positions]
+        codes[classes[codes] != values] = -1
+        return codes
+
+    def lookup_many(self, crops: List[str], months: List[int], markets: List[str]):
+        """
+        Predicted prices in ₹/kg for many queries at once.
+
+        Returns:
+            (prices, crop_codes, market_codes, valid) arrays; prices are NaN
+            where the crop or market is unknown or the month is out of range
+        """
+        crop_codes = self.encode(self.crops, crops, self.crop_order)
+        market_codes = self.encode(self.markets, markets, self.market_order)
+        # Out-of-range months become 0 (invalid) before the cast, so huge
+        # values can't overflow int64 and fail the whole batch
+        months = np.fromiter((month if 1 <= month <= MONTHS else 0 for month in months),
+                             dtype=np.int64, count=len(months))
+        valid = (crop_codes >= 0) & (market_codes >= 0) & (months >= 1) & (months <= MONTHS)
+
+        prices = np.full(len(months), np.nan)
+        prices[valid] = self.prices[crop_codes[valid], months[valid] - 1, market_codes[valid]]
+        return prices, crop_codes, market_codes, valid
+
+
+# Forest artifact layout version this evaluator understands (ml/export_model.py)
+FOREST_FORMAT_VERSION = 1
+
+# Rows evaluated per step, bounding the (rows x trees) working arrays
+FOREST_CHUNK_ROWS = 8192
+
+
+def mmap_npz(path: str) -> dict:
+    """
+    Memory-map every member of an uncompressed .npz.
+
+    np.load ignores mmap_mode for .npz archives and reads members into
+    private memory, so each member's .npy header is parsed in place and
+    its data mapped with np.memmap. All workers mapping the same file
+    then share one page-cache copy.
+    """
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} is compressed and can't be memory-mapped")
+            # Local file header: fixed 30 bytes, then file name and extra field
+            f.seek(info.header_offset)
+            header = f.read(30)
+            name_length, extra_length = struct.unpack('<HH', header[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')] if info.filename.endswith('.npy') else info.filename
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                order='F' if fortran_order else 'C'
+            )
+    return arrays
+
+
+class ForestModel:
+    """
+    Pure-NumPy evaluator for a random forest exported by ml/export_model.py.
+
+    All trees live in shared flat node arrays (feature, threshold, left,
+    right, value) with leaves pointing to themselves, so a batch is
+    evaluated by stepping every (row, tree) pair max_depth times at once
+    and averaging the leaf values - the same result as
+    RandomForestRegressor.predict, without sklearn.
+    """
+
+    def __init__(self, arrays: dict, max_depth: int):
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.left = arrays['left']
+        self.right = arrays['right']
+        self.value = arrays['value']
+        self.roots = np.asarray(arrays['roots'])
+        self.max_depth = max_depth
+
+    @property
+    def n_estimators(self) -> int:
+        return len(self.roots)
 
-try:
-    with open(model_path, 'rb') as f:
+    def predict(self, features) -> np.ndarray:
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(features, dtype=np.float32)
+        predictions = np.empty(len(X))
+        for start in range(0, len(X), FOREST_CHUNK_ROWS):
+            chunk = X[start:start + FOREST_CHUNK_ROWS]
+            rows = np.arange(len(chunk))[:, None]
+            nodes = np.broadcast_to(self.roots, (len(chunk), len(self.roots)))
+            for _ in range(self.max_depth):
+                go_left = chunk[rows, self.feature[nodes]] <= self.threshold[nodes]
+                nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+            predictions[start:start + len(chunk)] = self.value[nodes].mean(axis=1)
+        return predictions
+
+
+def read_forest_artifact(path: str) -> dict:
+    """
+    Memory-map an exported forest (.npz) as a model_data dict for
+    install_model(). Loads in milliseconds and needs only NumPy.
+
+    Raises:
+        ValueError: Unsupported artifact format version
+    """
+    arrays = mmap_npz(path)
+    meta = json.loads(bytes(arrays['meta']).decode('utf-8'))
+    if meta.get('format_version') != FOREST_FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported model artifact version {meta.get('format_version')} "
+            f"(expected {FOREST_FORMAT_VERSION})"
+        )
+    model_data = dict(meta)
+    model_data['model'] = ForestModel(arrays, meta['max_depth'])
+    model_data['crops'] = np.array(arrays['crops']).tolist()
+    model_data['markets'] = np.array(arrays['markets']).tolist()
+    return model_data
+
+
+def read_pickle_artifact(path: str) -> dict:
+    """Unpickle price_model.pkl (slow: imports sklearn and scipy)"""
+    with open(path, 'rb') as f:
         model_data = pickle.load(f)
-        model = model_data['model']
-        le_crop = model_data['le_crop']
-        le_market = model_data['le_market']
-        supported_crops = model_data.get('supported_crops', le_crop.classes_.tolist())
-        supported_markets = model_data.get('supported_markets', le_market.classes_.tolist())
-        price_unit = model_data.get('price_unit', 'quintal')  # Check if price is per quintal or kg
+    model_data['crops'] = model_data['le_crop'].classes_.tolist()
+    model_data['markets'] = model_data['le_market'].classes_.tolist()
+    return model_data
+
+
+def price_range(predicted_price_kg: float) -> tuple:
+    """
+    (predicted, min, max) prices in ₹/kg around a model prediction.
+
+    Adds ±15% variation for a realistic price range: government data shows
+    natural price variation due to quality and market conditions.
+    """
+    min_price = round(predicted_price_kg * (1 - PRICE_VARIATION), 2)
+    max_price = round(predicted_price_kg * (1 + PRICE_VARIATION), 2)
+    predicted_price_kg = round(predicted_price_kg, 2)
+    
+    # Ensure minimum sensible prices (at least ₹1/kg)
+    return (
+        max(PREDICTED_PRICE_FLOOR, predicted_price_kg),
+        max(MIN_PRICE_FLOOR, min_price),
+        max(MAX_PRICE_FLOOR, max_price)
+    )
+
+
+# Smoke set every new model must price sensibly before it is swapped in
+SMOKE_QUERIES = [("tomato", 12), ("onion", 3), ("wheat", 6), ("potato", 1), ("rice", 9)]
+SMOKE_PRICE_RANGE_KG = (0.5, 5000.0)
+
+
+class ActiveModel:
+    """
+    Everything one loaded model serves from. Requests read the module's
+    `active_model` once, so a reload swaps model, encoders and price
+    table together with a single reference assignment.
+    """
+
+    __slots__ = (
+        "model", "price_table", "supported_crops", "supported_markets",
+        "price_unit", "default_market", "version", "source", "loaded_at"
+    )
+
+    def __init__(self, model_data: dict, source: str = None):
+        self.price_unit = model_data.get('price_unit', 'quintal')  # Check if price is per quintal or kg
+        self.model = model_data['model']
+        self.price_table = PriceTable(self.model, model_data['crops'], model_data['markets'], price_unit=self.price_unit)
+        self.supported_crops = model_data.get('supported_crops', model_data['crops'])
+        self.supported_markets = model_data.get('supported_markets', model_data['markets'])
+        # Use a default market (first available) for simplicity in demo
+        # In production, this could be based on user location
+        self.default_market = self.supported_markets[0] if self.supported_markets else "Delhi"
+        self.version = {
+            "training_date": model_data.get('training_date'),
+            "r2_score": model_data.get('r2_score'),
+            "update_r2_score": model_data.get('update_r2_score'),
+            "data_rows": model_data.get('data_rows'),
+            "data_end": model_data.get('data_end'),
+            "updates": max(0, len(model_data.get('lineage') or ()) - 1)
+        }
+        self.source = source
+        self.loaded_at = datetime.now().isoformat()
+
+    def validate(self):
+        """
+        Check the model before it serves traffic.
+
+        Raises:
+            ValueError: Empty model, non-finite/non-positive prices, or a
+                        smoke query priced outside SMOKE_PRICE_RANGE_KG or
+                        differently by the table and the model
+        """
+        table = self.price_table
+        if not self.supported_crops or table.prices.size == 0:
+            raise ValueError("Model supports no crops")
+        if not np.all(np.isfinite(table.prices)) or np.any(table.prices <= 0):
+            raise ValueError("Model predicts non-finite or non-positive prices")
+
+        low, high = SMOKE_PRICE_RANGE_KG
+        market_code = table.market_index[self.default_market]
+        for crop, month in SMOKE_QUERIES:
+            if crop not in table.crop_index:
+                continue
+            price_kg = table.lookup(crop, month, self.default_market)
+            direct = float(self.model.predict([[table.crop_index[crop], month, market_code]])[0])
+            if self.price_unit == 'quintal':
+                direct /= 100
+            if not low <= price_kg <= high:
+                raise ValueError(f"Smoke check failed: {crop} in month {month} priced at ₹{price_kg:.2f}/kg")
+            if not np.isclose(direct, price_kg):
+                raise ValueError(f"Smoke check failed: table and model disagree for {crop} in month {month}")
+
+    def info(self) -> dict:
+        return {**self.version, "source": self.source, "loaded_at": self.loaded_at}
+
+
+active_model = None
+
+
+def install_model(model_data: dict, source: str = None):
+    """
+    Make a trained model current: build its price table, validate it, then
+    swap it in. On any error the current model keeps serving.
+
+    Args:
+        model_data: From read_forest_artifact() or read_pickle_artifact()
+        source: Artifact path, for /health
+    """
+    global active_model
+    candidate = ActiveModel(model_data, source=source)
+    candidate.validate()
+    active_model = candidate
+    # Buyer listings are priced by this model from now on
+    set_price_predictor(model_price_ranges)
+
+
+def model_price_ranges(keys: list) -> list:
+    """
+    Batch predictor for buyer listings (see pricing.set_price_predictor).
+    Crops the model doesn't know keep their fallback table range.
+    """
+    active = active_model
+    prices, _, _, valid = active.price_table.lookup_many(
+        [crop for crop, _, _ in keys],
+        [month for _, month, _ in keys],
+        [market or active.default_market for _, _, market in keys]
+    )
+    fallback = table_price_ranges(keys)
+    return [
+        price_range(float(price))[1:] if ok else default
+        for price, ok, default in zip(prices, valid, fallback)
+    ]
+
+
+# Mock prices (₹/kg) served while the model is loading or missing
+MOCK_PRICES = {
+    "wheat": {"min": 20, "max": 25, "predicted": 22},
+    "rice": {"min": 35, "max": 45, "predicted": 40},
+    "tomato": {"min": 10, "max": 20, "predicted": 15},
+    "onion": {"min": 15, "max": 25, "predicted": 20},
+    "potato": {"min": 12, "max": 18, "predicted": 15},
+    "carrot": {"min": 15, "max": 25, "predicted": 20},
+    "cauliflower": {"min": 20, "max": 35, "predicted": 27},
+    "cabbage": {"min": 10, "max": 18, "predicted": 14},
+    "brinjal": {"min": 15, "max": 25, "predicted": 20},
+    "garlic": {"min": 80, "max": 120, "predicted": 100},
+    "apple": {"min": 50, "max": 80, "predicted": 65},
+    "banana": {"min": 20, "max": 35, "predicted": 27},
+    "mango": {"min": 40, "max": 70, "predicted": 55},
+}
+DEFAULT_MOCK_PRICE = {"min": 20, "max": 30, "predicted": 25}
+
+# What /predict-price does before the model is ready: "mock" answers from
+# MOCK_PRICES, "503" refuses with Service Unavailable
+PRICE_FALLBACK = os.environ.get("GAON_PRICE_FALLBACK", "mock")
+
+# Time to price one request (single lookup or whole batch)
+inference_seconds = register(Histogram(
+    "gaon_price_inference_seconds", "Price model inference time per request",
+    ("kind",),
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+))
+
+# Batches up to this size are priced inline; larger ones go to the
+# inference executor so they don't block the event loop
+INLINE_BATCH_SIZE = 64
+INFERENCE_WORKERS = 2
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="price-inference")
+
+# Seconds clients are told to wait while the model is loading
+LOADING_RETRY_AFTER = 5
+
+# Seconds between checks of the model files for a retrained model (0 = off)
+MODEL_WATCH_INTERVAL = float(os.environ.get("GAON_MODEL_WATCH_INTERVAL", "10"))
+
+# POST /admin/reload-model requires this X-Admin-Token; unset disables it
+ADMIN_TOKEN = os.environ.get("GAON_ADMIN_TOKEN")
+
+# The exported forest is preferred; the pickle is the fallback
+forest_path = os.path.join(os.path.dirname(__file__), '..', 'ml', 'price_model.npz')
+model_path = os.path.join(os.path.dirname(__file__), '..', 'ml', 'price_model.pkl')
+
+# "not_loaded" -> "loading" -> "ready" | "missing" | "failed"
+model_status = "not_loaded"
+model_error = None
+# Outcome of the latest reload of an already-serving model
+last_reload = None
+_loader = None
+_loader_lock = threading.Lock()
+_load_lock = threading.Lock()
+_watcher = None
+
+
+def artifact_signature() -> tuple:
+    """(mtime, size) of each model file, to notice when one is rewritten"""
+    signature = []
+    for path in (forest_path, model_path):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def load_model() -> bool:
+    """
+    Load, validate and install the model: the memory-mapped forest export
+    if there is one, otherwise the pickle (slow: imports sklearn and scipy).
+    Runs on a background thread; loads never overlap.
+
+    Returns:
+        True if a new model was swapped in
+    """
+    global model_status, model_error, last_reload
+    with _load_lock:
+        reloading = active_model is not None
+        if not reloading:
+            model_status = "loading"
+        started = time.perf_counter()
+        path = forest_path if os.path.exists(forest_path) else model_path
+        try:
+            if path == forest_path:
+                install_model(read_forest_artifact(path), source=path)
+            else:
+                install_model(read_pickle_artifact(path), source=path)
+        except Exception as e:
+            if reloading:
+                # Keep serving the current model
+                last_reload = {"ok": False, "at": datetime.now().isoformat(), "error": str(e)}
+                print(f"[WARN] Price model reload failed, keeping current model: {str(e)}")
+            elif isinstance(e, FileNotFoundError):
+                model_status = "missing"
+                print("[WARN] Model file not found at " + model_path)
+                print("Please run: python ml/train_model.py")
+            else:
+                model_status = "failed"
+                model_error = str(e)
+                print(f"[ERROR] Price model failed to load: {str(e)}")
+            return False
+        
+        active = active_model
+        model_status = "ready"
+        model_error = None
+        if reloading:
+            last_reload = {"ok": True, "at": datetime.now().isoformat(), "error": None}
+        print(f"[OK] Price prediction model {'reloaded' if reloading else 'loaded successfully'} in {time.perf_counter() - started:.3f}s!")
+        print(f"[INFO] Model trained: {active.version['training_date']} (R² {active.version['r2_score']})")
+        print(f"[INFO] Supported crops: {len(active.supported_crops)}")
+        print(f"[INFO] Supported markets: {len(active.supported_markets)}")
+        print(f"[INFO] Price unit in model: {active.price_unit}")
+        print(f"[INFO] Price table: {active.price_table.prices.size} precomputed predictions")
+        return True
+
+
+def reload_model() -> bool:
+    """
+    Start loading the model files again on a background thread.
+
+    Returns:
+        False if a load is already in progress
+    """
+    global _loader
+    with _loader_lock:
+        if _loader is not None and _loader.is_alive():
+            return False
+        _loader = threading.Thread(target=load_model, name="price-model-loader", daemon=True)
+        _loader.start()
+        return True
+
+
+def watch_model_files(interval: float):
+    """Reload whenever a model file changes (runs on the watcher thread)"""
+    signature = artifact_signature()
+    while True:
+        time.sleep(interval)
+        current = artifact_signature()
+        if current != signature:
+            signature = current
+            # Let the writer finish before reading (the pickle isn't renamed into place)
+            time.sleep(min(interval, 1.0))
+            signature = artifact_signature()
+            load_model()
+
+
+def start_model_loading():
+    """Load the model and start watching its files, in the background (once)"""
+    global _watcher
+    with _loader_lock:
+        started = _loader is not None
+    if started:
+        return
+    reload_model()
+    if MODEL_WATCH_INTERVAL > 0 and _watcher is None:
+        _watcher = threading.Thread(
+            target=watch_model_files, args=(MODEL_WATCH_INTERVAL,),
+            name="price-model-watcher", daemon=True
+        )
+        _watcher.start()
+
+
+def model_ready() -> bool:
+    return active_model is not None
+
+
+def model_status_info() -> dict:
+    """Model readiness and active version for /health"""
+    active = active_model
+    return {
+        "ready": active is not None,
+        "status": model_status,
+        "error": model_error,
+        "version": active.info() if active is not None else None,
+        "last_reload": last_reload
+    }
+
+
+def model_unavailable() -> HTTPException:
+    """503 for requests that need the model before it is ready"""
+    if model_status in ("not_loaded", "loading"):
+        return HTTPException(
+            status_code=503,
+            detail="Price prediction model is still loading. Please retry shortly.",
+            headers={"Retry-After": str(LOADING_RETRY_AFTER)}
+        )
+    return HTTPException(
+        status_code=503,
+        detail="Price prediction model not loaded. Please train the model first."
+    )
+
+def price_batch(active: ActiveModel, queries: List[BatchPriceQuery]) -> BatchPricePredictionOutput:
+    """
+    Price a batch against one model (pure CPU work, safe to run off the
+    event loop): vectorized encoding and one table read for all queries.
+    """
+    started = time.perf_counter()
+    default_market = active.default_market
+    crops = [query.crop.lower().strip() for query in queries]
+    months = [query.month for query in queries]
+    markets = [query.market.strip() if query.market else default_market for query in queries]
+    
+    prices, crop_codes, market_codes, valid = active.price_table.lookup_many(crops, months, markets)
+    
+    results = []
+    for i, (crop, month, market) in enumerate(zip(crops, months, markets)):
+        if valid[i]:
+            predicted_price_kg, min_price, max_price = price_range(float(prices[i]))
+            results.append(BatchPriceResult(
+                crop=crop,
+                month=month,
+                market=market,
+                predicted_price=predicted_price_kg,
+                min_price=min_price,
+                max_price=max_price
+            ))
+            continue
         
-    print("[OK] Price prediction model loaded successfully!")
-    print(f"[INFO] Supported crops: {len(supported_crops)}")
-    print(f"[INFO] Supported markets: {len(supported_markets)}")
-    print(f"[INFO] Price unit in model: {price_unit}")
-except FileNotFoundError:
-    print("[WARN] Model file not found at " + model_path)
-    print("Please run: python ml/train_model.py")
-    model = None
-    supported_crops = []
-    supported_markets = []
-    price_unit = 'quintal'
+        if crop_codes[i] < 0:
+            error = f"Crop '{crop}' not supported"
+        elif market_codes[i] < 0:
+            error = f"Market '{market}' not supported"
+        else:
+            error = f"Invalid month: {month}. Must be between 1 and 12."
+        results.append(BatchPriceResult(crop=crop, month=month, market=market, error=error))
+    
+    output = BatchPricePredictionOutput(results=results)
+    inference_seconds.observe(time.perf_counter() - started, "batch")
+    return output
+
+def price_batch_json(active: ActiveModel, queries: List[BatchPriceQuery]) -> bytes:
+    return price_batch(active, queries).model_dump_json().encode()
 
 @router.post("/predict-price", response_model=PricePredictionOutput)
 async def predict_price(prediction_input: PricePredictionInput):
@@ -68,13 +645,11 @@ async def predict_price(prediction_input: PricePredictionInput):
     
     Note: Prices are converted from quintal (100kg) to per kg for user convenience.
     The prediction uses real government agricultural market data.
-    """
     
-    if model is None:
-        raise HTTPException(
-            status_code=503,
-            detail="Price prediction model not loaded. Please train the model first."
-        )
+    The model loads in the background after startup; until it is ready the
+    response comes from a mock table ("source": "mock"), or is a 503 when
+    GAON_PRICE_FALLBACK=503.
+    """
     
     crop = prediction_input.crop.lower().strip()
     month = prediction_input.month
@@ -86,45 +661,35 @@ async def predict_price(prediction_input: PricePredictionInput):
             detail=f"Invalid month: {month}. Must be between 1 and 12."
         )
     
+    # Until the model is ready, answer from the mock table (or refuse)
+    active = active_model
+    if active is None:
+        if PRICE_FALLBACK != "mock":
+            raise model_unavailable()
+        prices = MOCK_PRICES.get(crop, DEFAULT_MOCK_PRICE)
+        return PricePredictionOutput(
+            crop=crop,
+            month=month,
+            predicted_price=prices["predicted"],
+            min_price=prices["min"],
+            max_price=prices["max"],
+            source="mock"
+        )
+    
     # Check if crop is supported
-    if crop not in supported_crops:
+    if crop not in active.supported_crops:
         raise HTTPException(
             status_code=400,
-            detail=f"Crop '{crop}' not supported. Available crops: {', '.join(sorted(supported_crops)[:10])}..."
+            detail=f"Crop '{crop}' not supported. Available crops: {', '.join(sorted(active.supported_crops)[:10])}..."
         )
     
-    # Use a default market (first available) for simplicity in demo
-    # In production, this could be based on user location
-    default_market = supported_markets[0] if supported_markets else "Delhi"
-    
     try:
-        # Encode inputs
-        crop_encoded = le_crop.transform([crop])[0]
-        market_encoded = le_market.transform([default_market])[0]
-        
-        # Create feature vector (crop, month, market)
-        features = np.array([[crop_encoded, month, market_encoded]])
-        
-        # Make prediction
-        predicted_price_quintal = float(model.predict(features)[0])
-        
-        # Convert from quintal (100kg) to per kg for user-friendly display
-        if price_unit == 'quintal':
-            predicted_price_kg = predicted_price_quintal / 100
-        else:
-            predicted_price_kg = predicted_price_quintal  # Already in kg
-        
-        # Add ±15% variation for realistic price range
-        # Government data shows natural price variation due to quality, market conditions
-        variation_percent = 0.15
-        min_price = round(predicted_price_kg * (1 - variation_percent), 2)
-        max_price = round(predicted_price_kg * (1 + variation_percent), 2)
-        predicted_price_kg = round(predicted_price_kg, 2)
-        
-        # Ensure minimum sensible prices (at least ₹1/kg)
-        min_price = max(1.0, min_price)
-        max_price = max(2.0, max_price)
-        predicted_price_kg = max(1.5, predicted_price_kg)
+        # O(1) read from the precomputed table instead of a model call
+        started = time.perf_counter()
+        predicted_price_kg, min_price, max_price = price_range(
+            active.price_table.lookup(crop, month, active.default_market)
+        )
+        inference_seconds.observe(time.perf_counter() - started, "single")
         
         return PricePredictionOutput(
             crop=crop,
@@ -136,7 +701,7 @@ async def predict_price(prediction_input: PricePredictionInput):
             unit="kg"
         )
     
-    except ValueError as e:
+    except KeyError as e:
         raise HTTPException(
             status_code=400,
             detail=f"Error processing crop: {crop}. {str(e)}"
@@ -151,3 +716,76 @@ async def predict_price(prediction_input: PricePredictionInput):
             status_code=500,
             detail=f"Error in price prediction: {str(e)}"
         )
+
+@router.post("/predict-price/batch", response_model=BatchPricePredictionOutput)
+async def predict_price_batch(batch_input: BatchPricePredictionInput):
+    """
+    Predict prices for many (crop, month, market) combinations in one call.
+    
+    The whole batch is encoded with vectorized label lookups and answered
+    with one fancy-indexed read of the precomputed price table, so cost
+    grows with the batch size only through array operations. Results
+    come back in input order; a query with an unsupported crop, market or
+    month gets an `error` instead of prices and doesn't fail the batch.
+    Returns 503 (with Retry-After) until the model has loaded.
+    
+    Example input:
+    {
+      "queries": [
+        {"crop": "tomato", "month": 12},
+        {"crop": "onion", "month": 3, "market": "Agra"},
+        {"crop": "dragonfruit", "month": 5}
+      ]
+    }
+    
+    Returns:
+    {
+      "results": [
+        {"crop": "tomato", "month": 12, "market": "Agra", "predicted_price": 30.5, ...},
+        {"crop": "onion", "month": 3, "market": "Agra", "predicted_price": 18.2, ...},
+        {"crop": "dragonfruit", "month": 5, "market": "Agra", "error": "Crop 'dragonfruit' not supported"}
+      ],
+      "currency": "INR",
+      "unit": "kg"
+    }
+    """
+    
+    active = active_model
+    if active is None:
+        raise model_unavailable()
+    
+    queries = batch_input.queries
+    if len(queries) <= INLINE_BATCH_SIZE:
+        return price_batch(active, queries)
+    
+    # Large batches would stall every other request on the event loop, so
+    # they are priced and serialized (FastAPI would otherwise re-validate
+    # the response on the loop) on the inference executor
+    loop = asyncio.get_running_loop()
+    body = await loop.run_in_executor(inference_executor, price_batch_json, active, queries)
+    return Response(content=body, media_type="application/json")
+
+@router.post("/admin/reload-model", status_code=202)
+async def reload_price_model(x_admin_token: Optional[str] = Header(None)):
+    """
+    Reload the price model from ml/ without restarting the server.
+    
+    The new artifact is loaded and validated against a smoke set in the
+    background; requests keep being answered by the current model until
+    the new one is swapped in. If it fails to load or validate, the
+    current model stays. Progress shows up on /health (price_model).
+    Files are also watched, so a retrain is picked up automatically
+    within GAON_MODEL_WATCH_INTERVAL seconds.
+    
+    Requires the X-Admin-Token header to match GAON_ADMIN_TOKEN; without
+    GAON_ADMIN_TOKEN configured the endpoint is disabled (404).
+    
+    Returns:
+    {"status": "reloading"}  (or "already_reloading")
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+    
+    return {"status": "reloading" if reload_model() else "already_reloading"}
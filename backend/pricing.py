@@ -0,0 +1,115 @@
+import time
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from cache import TTLCache
+from store import normalize_key
+
+# Fallback price ranges (₹/kg) used until a model-backed predictor is set
+PRICE_RANGES = {
+    "tomato": (25, 35),
+    "potato": (15, 25),
+    "onion": (20, 30),
+    "carrot": (30, 40),
+    "cucumber": (25, 35),
+    "eggplant": (30, 45),
+}
+DEFAULT_PRICE_RANGE = (20, 40)
+
+# Resolved ranges, keyed by (generation, (crop, month, market))
+PRICE_CACHE_SIZE = 4096
+PRICE_CACHE_TTL_SECONDS = 3600.0
+price_cache = TTLCache(maxsize=PRICE_CACHE_SIZE, ttl=PRICE_CACHE_TTL_SECONDS)
+
+PriceKey = Tuple[str, int, Optional[str]]
+PricePredictor = Callable[[List[PriceKey]], List[Tuple[float, float]]]
+
+
+def table_price_ranges(keys: List[PriceKey]) -> List[Tuple[float, float]]:
+    """Batch predictor backed by the static PRICE_RANGES table"""
+    return [PRICE_RANGES.get(crop, DEFAULT_PRICE_RANGE) for crop, _, _ in keys]
+
+
+price_predictor: PricePredictor = table_price_ranges
+
+# Bumped whenever the predictor changes. Cache keys (here and in response
+# caches) include it, so prices from an older model are never served.
+price_generation = 0
+prices_updated_at = time.time()
+
+
+def set_price_predictor(predictor: PricePredictor):
+    """
+    Replace the batch price predictor and drop cached ranges.
+
+    Args:
+        predictor: Called with a list of (crop, month, market) keys, returns
+                   one (min_price, max_price) per key, in the same order
+    """
+    global price_predictor, price_generation, prices_updated_at
+    price_predictor = predictor
+    price_generation += 1
+    prices_updated_at = time.time()
+    price_cache.clear()
+
+
+def get_price_version() -> Tuple[int, float]:
+    """
+    Returns:
+        (generation, time of the last predictor change)
+    """
+    return price_generation, prices_updated_at
+
+
+def get_price_ranges(
+    crops: Iterable[str],
+    month: Optional[int] = None,
+    market: Optional[str] = None
+) -> Dict[str, Tuple[float, float]]:
+    """
+    Price ranges for several crops with at most one predictor call.
+
+    Cached ranges are reused; all misses go to the predictor together.
+    Cost therefore scales with the number of distinct uncached crops,
+    not with how many listings share them.
+
+    Args:
+        crops: Crop names (duplicates are fine)
+        month: Month to price for (default: current month)
+        market: Market to price for (default: the predictor's default)
+
+    Returns:
+        Dict mapping each crop name as given to (min_price, max_price)
+    """
+    if month is None:
+        month = datetime.now().month
+    generation, predictor = price_generation, price_predictor
+    keys: Dict[str, PriceKey] = {}
+    for crop in crops:
+        if crop not in keys:
+            keys[crop] = (normalize_key(crop), month, market)
+
+    ranges: Dict[PriceKey, Tuple[float, float]] = {}
+    missing: List[PriceKey] = []
+    for key in dict.fromkeys(keys.values()):
+        cached = price_cache.get((generation, key))
+        if cached is None:
+            missing.append(key)
+        else:
+            ranges[key] = cached
+
+    if missing:
+        for key, price_range in zip(missing, predictor(missing)):
+            price_cache.put((generation, key), price_range)
+            ranges[key] = price_range
+
+    return {crop: ranges[key] for crop, key in keys.items()}
+
+
+def get_price_range_for_crop(crop: str) -> Tuple[float, float]:
+    """
+    Get the price range for a single crop (cached).
+
+    Returns:
+        (min_price, max_price) in ₹/kg
+    """
+    return get_price_ranges([crop])[crop]
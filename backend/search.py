@@ -0,0 +1,205 @@
+import re
+from typing import Dict, List, Optional, Tuple
+from store import IdBucket, add_store_listener, get_all_listings, normalize_key, sync_listings
+from voice import CROP_MAPPING
+
+# Ranking weights per matched query term
+CROP_WEIGHT = 2.0
+LOCATION_WEIGHT = 1.0
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens (Unicode-aware, so Devanagari works too)"""
+    return TOKEN_PATTERN.findall(str(text).lower())
+
+
+def canonical_crop(crop: str) -> str:
+    """Map a crop name or Hindi/Hinglish alias to its canonical English name"""
+    key = normalize_key(crop)
+    return CROP_MAPPING.get(key, key)
+
+
+class SearchIndex:
+    """
+    Inverted index over listings for free-text buyer search.
+
+    Each listing is indexed under three kinds of terms:
+    - ("crop", canonical crop), so any CROP_MAPPING alias finds it
+    - ("loc", word) for every word of its location
+    - ("pair", canonical crop, word), so "crop AND location" matches are
+      read straight from a posting list instead of intersecting two large
+      ones (which costs a full scan when the intersection is empty)
+
+    Postings are IdBuckets, so they can be walked newest-first and checked
+    for membership in O(1). The index is kept current by a store listener
+    and only holds available listings.
+    """
+
+    def __init__(self):
+        self.postings: Dict[Tuple[str, ...], IdBucket] = {}
+        self.terms_by_id: Dict[int, List[Tuple[str, ...]]] = {}
+        # Alias token sequences (e.g. ("phool", "gobhi")) -> canonical crop
+        self.aliases: Dict[Tuple[str, ...], str] = {}
+        for alias, crop in CROP_MAPPING.items():
+            self.aliases[tuple(tokenize(alias))] = crop
+            self.aliases[tuple(tokenize(crop))] = crop
+        self.max_alias_tokens = max(len(tokens) for tokens in self.aliases)
+
+    @staticmethod
+    def listing_terms(listing: Dict) -> List[Tuple[str, ...]]:
+        crop = canonical_crop(listing["crop"])
+        words = list(dict.fromkeys(tokenize(listing.get("location", ""))))
+        terms = [("crop", crop)]
+        terms.extend(("loc", word) for word in words)
+        terms.extend(("pair", crop, word) for word in words)
+        return terms
+
+    def add(self, listing: Dict):
+        # Only listings buyers can order are searchable; a sold-out listing
+        # leaves the index on its update and returns if it is restocked
+        if listing["status"] != "available" or listing["quantity"] <= 0:
+            return
+        terms = self.listing_terms(listing)
+        self.terms_by_id[listing["id"]] = terms
+        for term in terms:
+            bucket = self.postings.get(term)
+            if bucket is None:
+                bucket = self.postings[term] = IdBucket()
+            bucket.add(listing)
+
+    def remove(self, listing_id: int):
+        for term in self.terms_by_id.pop(listing_id, ()):
+            bucket = self.postings.get(term)
+            if bucket is None:
+                continue
+            bucket.remove(listing_id)
+            if not bucket:
+                del self.postings[term]
+
+    def clear(self):
+        self.postings = {}
+        self.terms_by_id = {}
+
+    def on_store_event(self, event: str, listing: Optional[Dict]):
+        """Store listener keeping the index in sync with add/update/delete"""
+        if event == "cleared":
+            self.clear()
+        elif event == "removed":
+            self.remove(listing["id"])
+        else:
+            self.remove(listing["id"])
+            self.add(listing)
+
+    def parse_query(self, query: str) -> Tuple[List[str], List[str]]:
+        """
+        Split a query into crop names and location words.
+
+        Multi-word aliases are matched greedily, longest first. A single
+        word may count as both a crop and a location word; which one has
+        postings decides how it's used.
+
+        Returns:
+            (canonical crops, location words)
+        """
+        tokens = tokenize(query)
+        crops, words = {}, {}
+        i = 0
+        while i < len(tokens):
+            matched = 0
+            for size in range(min(self.max_alias_tokens, len(tokens) - i), 0, -1):
+                crop = self.aliases.get(tuple(tokens[i:i + size]))
+                if crop is not None:
+                    crops[crop] = True
+                    matched = size
+                    break
+            if matched == 0:
+                # Unknown word: could be a crop not in CROP_MAPPING or a location
+                crops[tokens[i]] = True
+                matched = 1
+            if matched == 1:
+                words[tokens[i]] = True
+            i += matched
+        crops = [crop for crop in crops if ("crop", crop) in self.postings]
+        words = [word for word in words if ("loc", word) in self.postings]
+        return crops, words
+
+    def _collect(self, terms: List[Tuple[str, ...]], limit: int, seen: set, score) -> List[Tuple[float, Dict]]:
+        """Up to `limit` newest unseen listings from each posting list, scored and ranked"""
+        found = []
+        for term in terms:
+            bucket = self.postings.get(term)
+            if bucket is None:
+                continue
+            taken = 0
+            for listing in bucket.newest():
+                if listing["id"] in seen:
+                    continue
+                seen.add(listing["id"])
+                found.append((score(listing), listing))
+                taken += 1
+                if taken >= limit:
+                    break
+        found.sort(key=lambda item: (-item[0], -item[1]["id"]))
+        return found[:limit]
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[float, Dict]]:
+        """
+        Ranked search, best matches first and newest first within a score.
+
+        Crop words are alternatives (a listing has one crop), as are
+        location words. Results come in three tiers: crop AND location
+        (read from the "pair" postings), crop only, then location only.
+        The score is CROP_WEIGHT for a crop match plus LOCATION_WEIGHT per
+        matched location word. Each tier reads at most `limit` entries per
+        posting list, so cost tracks the result size, not the store.
+
+        Returns:
+            List of (score, listing)
+        """
+        crops, words = self.parse_query(query)
+        if not crops and not words:
+            return []
+
+        location_buckets = [self.postings[("loc", word)] for word in words]
+
+        def location_score(listing: Dict) -> float:
+            return LOCATION_WEIGHT * sum(1 for bucket in location_buckets if listing["id"] in bucket)
+
+        tiers = []
+        if crops and words:
+            tiers.append(([("pair", crop, word) for crop in crops for word in words],
+                          lambda listing: CROP_WEIGHT + location_score(listing)))
+        if crops:
+            tiers.append(([("crop", crop) for crop in crops], lambda listing: CROP_WEIGHT))
+        if words:
+            tiers.append(([("loc", word) for word in words], location_score))
+
+        results: List[Tuple[float, Dict]] = []
+        seen = set()
+        for terms, score in tiers:
+            results.extend(self._collect(terms, limit - len(results), seen, score))
+            if len(results) >= limit:
+                break
+        return results
+
+
+search_index = SearchIndex()
+for _listing in get_all_listings():
+    search_index.add(_listing)
+add_store_listener(search_index.on_store_event)
+
+def search_listings(query: str, limit: int = 20) -> List[Tuple[float, Dict]]:
+    """
+    Search listings by crop (English/Hindi/Hinglish aliases) and location.
+
+    Args:
+        query: Free text, e.g. "tamatar delhi"
+        limit: Maximum number of results
+
+    Returns:
+        List of (score, listing), best first
+    """
+    sync_listings()
+    return search_index.search(query, limit=limit)
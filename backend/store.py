@@ -1,119 +1,957 @@
+import math
+import threading
+import time
+from bisect import bisect_left, bisect_right
 from datetime import datetime
-from typing import List, Dict, Optional
+from functools import lru_cache
+from typing import Callable, Iterator, List, Dict, Optional
+from persistence import StaleWriteError, engine_from_env
 
-# In-memory storage for farmer listings (temporary for hackathon demo)
-listings_db: List[Dict] = []
-listing_counter = 0
+# Listing fields that get a secondary index (normalized value -> listings)
+INDEXED_FIELDS = ("crop", "location", "status", "quality_verified")
 
-def add_listing(crop: str, quantity: int, location: str = "Village X", language: str = "Hindi") -> Dict:
+# Defaults for fields missing from listings persisted by older versions
+FIELD_DEFAULTS = {"quality_verified": True, "lat": None, "lon": None, "price": None, "quantity_sold": 0}
+
+# Spatial grid cell size in degrees (~11 km of latitude)
+GRID_CELL_DEGREES = 0.1
+EARTH_RADIUS_KM = 6371.0
+
+# Listing fields with running per-value aggregates (see ListingStore.stats)
+AGGREGATED_FIELDS = ("crop", "location")
+
+
+@lru_cache(maxsize=8192)
+def normalize_key(value: str) -> str:
+    """Normalize an indexed value so lookups are case/whitespace-insensitive"""
+    return str(value).strip().lower()
+
+
+class IdBucket:
+    """
+    Set of listings keyed by ID that can also be walked in ID order from
+    any cursor.
+
+    `members` gives O(1) membership/removal; `ids` is a sorted ID list for
+    bisecting to a keyset cursor. Removals leave a stale ID in `ids` that is
+    skipped on reads and dropped when stale entries outnumber live ones.
+    """
+
+    __slots__ = ("members", "ids", "stale")
+
+    def __init__(self):
+        self.members: Dict[int, Dict] = {}
+        self.ids: List[int] = []
+        self.stale = 0
+
+    def __len__(self) -> int:
+        return len(self.members)
+
+    def __contains__(self, listing_id: int) -> bool:
+        return listing_id in self.members
+
+    def add(self, listing: Dict):
+        listing_id = listing["id"]
+        if listing_id in self.members:
+            self.members[listing_id] = listing
+            return
+        self.members[listing_id] = listing
+        ids = self.ids
+        if not ids or listing_id > ids[-1]:
+            ids.append(listing_id)
+            return
+        i = bisect_left(ids, listing_id)
+        if i < len(ids) and ids[i] == listing_id:
+            self.stale -= 1  # re-added after a removal: revive the stale entry
+        else:
+            ids.insert(i, listing_id)
+
+    def remove(self, listing_id: int):
+        if self.members.pop(listing_id, None) is None:
+            return
+        self.stale += 1
+        if self.stale > 32 and self.stale * 2 > len(self.ids):
+            self.ids = [i for i in self.ids if i in self.members]
+            self.stale = 0
+
+    def after(self, after_id: int = 0) -> Iterator[Dict]:
+        """Yield listings with ID > after_id in ID order"""
+        ids = self.ids
+        members = self.members
+        for i in range(bisect_right(ids, after_id), len(ids)):
+            listing = members.get(ids[i])
+            if listing is not None:
+                yield listing
+
+    def newest(self) -> Iterator[Dict]:
+        """Yield listings newest (highest ID) first"""
+        ids = self.ids
+        members = self.members
+        for i in range(len(ids) - 1, -1, -1):
+            listing = members.get(ids[i])
+            if listing is not None:
+                yield listing
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometres"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class SpatialGrid:
+    """
+    Uniform lat/lon grid of listings for radius queries.
+
+    A query only visits the cells overlapping the search circle's bounding
+    box, so its cost depends on how many listings are nearby, not on the
+    size of the store.
+    """
+
+    def __init__(self, cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        # Longitude cells wrap around at the antimeridian (180 == -180)
+        self.lon_cells = max(round(360 / cell_degrees), 1)
+        self.cells: Dict[tuple, Dict[int, Dict]] = {}
+
+    def _cell(self, lat: float, lon: float) -> tuple:
+        return (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees) % self.lon_cells)
+
+    def add(self, listing: Dict):
+        if listing.get("lat") is None or listing.get("lon") is None:
+            return
+        cell = self._cell(listing["lat"], listing["lon"])
+        self.cells.setdefault(cell, {})[listing["id"]] = listing
+
+    def remove(self, listing: Dict):
+        if listing.get("lat") is None or listing.get("lon") is None:
+            return
+        cell = self._cell(listing["lat"], listing["lon"])
+        bucket = self.cells.get(cell)
+        if bucket is None:
+            return
+        bucket.pop(listing["id"], None)
+        if not bucket:
+            del self.cells[cell]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[tuple]:
+        """
+        Listings within `radius_km` of a point.
+
+        Returns:
+            List of (distance_km, listing), nearest first
+        """
+        dlat = radius_km / 111.0
+        # Longitude degrees shrink towards the poles (measured at the box
+        # edge nearest one); a box reaching past it spans every longitude
+        edge = math.radians(min(abs(lat) + dlat, 90.0))
+        lon_km = 111.0 * math.cos(edge)
+        dlon = radius_km / lon_km if lon_km * 180.0 > radius_km else 180.0
+        min_x = math.floor(max(lat - dlat, -90.0) / self.cell_degrees)
+        max_x = math.floor(min(lat + dlat, 90.0) / self.cell_degrees)
+        first_y = math.floor((lon - dlon) / self.cell_degrees)
+        last_y = math.floor((lon + dlon) / self.cell_degrees)
+        if last_y - first_y + 1 >= self.lon_cells:
+            columns = set(range(self.lon_cells))
+        else:
+            columns = {y % self.lon_cells for y in range(first_y, last_y + 1)}
+
+        # Wide boxes (large radius, near the poles) can hold far more cells
+        # than are occupied; then walk the occupied cells instead
+        if (max_x - min_x + 1) * len(columns) > len(self.cells):
+            keys = [key for key in self.cells if min_x <= key[0] <= max_x and key[1] in columns]
+        else:
+            keys = [(x, y) for x in range(min_x, max_x + 1) for y in columns]
+
+        found = []
+        for key in keys:
+            bucket = self.cells.get(key)
+            if not bucket:
+                continue
+            for listing in bucket.values():
+                distance = haversine_km(lat, lon, listing["lat"], listing["lon"])
+                if distance <= radius_km:
+                    found.append((distance, listing))
+        found.sort(key=lambda item: (item[0], item[1]["id"]))
+        return found
+
+
+def new_aggregate() -> Dict:
+    """Empty marketplace aggregate"""
+    return {
+        "listings": 0,
+        "total_quantity": 0,
+        "available_listings": 0,
+        "available_quantity": 0,
+        "sold_listings": 0,
+        "sold_quantity": 0
+    }
+
+
+def apply_to_aggregate(aggregate: Dict, listing: Dict, sign: int):
+    """Add (sign=1) or remove (sign=-1) one listing's contribution to an aggregate"""
+    quantity = listing["quantity"] * sign
+    aggregate["listings"] += sign
+    aggregate["total_quantity"] += quantity
+    status = listing["status"]
+    if status in ("available", "sold"):
+        aggregate[f"{status}_listings"] += sign
+        aggregate[f"{status}_quantity"] += quantity
+    # Kilos already sold through orders (see ListingStore.adjust_quantity)
+    aggregate["sold_quantity"] += listing.get("quantity_sold", 0) * sign
+
+
+def check_quantity(quantity: int):
+    """Listings need stock to sell: reject zero or negative quantities"""
+    if quantity <= 0:
+        raise ValueError(f"Listing quantity must be positive, got {quantity}")
+
+
+def new_listing(listing_id: int, crop: str, quantity: int, location: str = "Village X", language: str = "Hindi",
+                quality_verified: bool = True, lat: Optional[float] = None, lon: Optional[float] = None,
+                price: Optional[float] = None) -> Dict:
+    """A fresh, available listing (see ListingStore.add for the fields)"""
+    return {
+        "id": listing_id,
+        "crop": crop,
+        "quantity": quantity,
+        "location": location,
+        "language": language,
+        "timestamp": datetime.now().isoformat(),
+        "status": "available",
+        "quality_verified": quality_verified,
+        "lat": lat,
+        "lon": lon,
+        "price": price,
+        "quantity_sold": 0
+    }
+
+
+class ListingStore:
+    """
+    Indexed in-memory store for farmer listings.
+
+    Listings are kept in a primary id -> listing map. Each field in
+    INDEXED_FIELDS has a secondary index from its normalized value to an
+    IdBucket of the listings carrying it, so lookups, filters, keyset
+    pagination and deletes never scan the whole store. Listings with
+    coordinates are also kept in a SpatialGrid for radius queries.
+
+    Marketplace aggregates (listing count, quantity, available vs. sold)
+    are kept for the whole store and per crop/location, and adjusted in
+    O(1) whenever a listing is indexed or unindexed, so stats never rescan.
+
+    Every mutation is expressed as a record ({"op": ..., ...}, see
+    persistence.py) and goes through _apply(). With a durable `engine` each
+    record is also written to it, and the store is rebuilt from it on
+    construction. With a shared engine (engine.shared is True) the engine
+    is the source of truth: records are written there first, IDs come from
+    its atomic counters, and every worker applies the shared change feed in
+    commit order via sync(), so all workers see the same marketplace.
+
+    `version` increases with every applied change (in shared mode it is the
+    global change-feed sequence, so all workers agree on it) and
+    `modified_at` is the wall-clock time of the last change; together they
+    let readers validate cached responses without comparing data.
+
+    Derived structures that live outside the store (e.g. the search index)
+    register with add_listener() and are called as listener(event, listing)
+    after every applied change, with event one of "added", "updated",
+    "removed" or "cleared" (listing is None for "cleared").
+    """
+
+    def __init__(self, engine=None):
+        self.engine = engine
+        self.shared = bool(getattr(engine, "shared", False))
+        self._lock = threading.RLock()
+        self._local_counters: Dict[str, int] = {}
+        self._listeners: List[Callable[[str, Optional[Dict]], None]] = []
+        self._version = 0
+        self.modified_at = time.time()
+        self._reset()
+
+        if engine is not None:
+            counter, listings = engine.load()
+            self._load(counter, listings)
+
+    def _reset(self):
+        self.listings: Dict[int, Dict] = {}
+        self.all_ids = IdBucket()
+        self.indexes: Dict[str, Dict[str, IdBucket]] = {
+            field: {} for field in INDEXED_FIELDS
+        }
+        self.totals = new_aggregate()
+        self.aggregates: Dict[str, Dict[str, Dict]] = {field: {} for field in AGGREGATED_FIELDS}
+        # Crop names as submitted (the index keys are normalized) -> listings
+        self.crop_names: Dict[str, int] = {}
+        self.grid = SpatialGrid()
+        self.counter = 0
+
+    def _load(self, counter: int, listings: List[Dict]):
+        for listing in sorted(listings, key=lambda l: l["id"]):
+            for field, default in FIELD_DEFAULTS.items():
+                listing.setdefault(field, default)
+            self.listings[listing["id"]] = listing
+            self._index(listing)
+            self._notify("added", listing)
+        self.counter = counter
+
+    def add_listener(self, listener: Callable[[str, Optional[Dict]], None]):
+        """Call `listener(event, listing)` after every applied change"""
+        self._listeners.append(listener)
+
+    def _notify(self, event: str, listing: Optional[Dict]):
+        for listener in self._listeners:
+            try:
+                listener(event, listing)
+            except Exception as e:
+                print(f"[ERROR] Listing store listener failed: {str(e)}")
+
+    def __len__(self) -> int:
+        return len(self.listings)
+
+    def _index(self, listing: Dict):
+        self.all_ids.add(listing)
+        for field in INDEXED_FIELDS:
+            key = normalize_key(listing[field])
+            bucket = self.indexes[field].get(key)
+            if bucket is None:
+                bucket = self.indexes[field][key] = IdBucket()
+            bucket.add(listing)
+        self.crop_names[listing["crop"]] = self.crop_names.get(listing["crop"], 0) + 1
+        self.grid.add(listing)
+        self._account(listing, 1)
+
+    def _unindex(self, listing: Dict):
+        self.all_ids.remove(listing["id"])
+        for field in INDEXED_FIELDS:
+            key = normalize_key(listing[field])
+            bucket = self.indexes[field].get(key)
+            if bucket is None:
+                continue
+            bucket.remove(listing["id"])
+            if not bucket:
+                del self.indexes[field][key]
+        count = self.crop_names.get(listing["crop"], 0) - 1
+        if count > 0:
+            self.crop_names[listing["crop"]] = count
+        else:
+            self.crop_names.pop(listing["crop"], None)
+        self.grid.remove(listing)
+        self._account(listing, -1)
+
+    def _account(self, listing: Dict, sign: int):
+        """Add (sign=1) or remove (sign=-1) a listing from the running aggregates"""
+        apply_to_aggregate(self.totals, listing, sign)
+        for field in AGGREGATED_FIELDS:
+            key = normalize_key(listing[field])
+            per_value = self.aggregates[field]
+            aggregate = per_value.get(key)
+            if aggregate is None:
+                aggregate = per_value[key] = new_aggregate()
+            apply_to_aggregate(aggregate, listing, sign)
+            if aggregate["listings"] == 0:
+                del per_value[key]
+
+    @property
+    def version(self) -> int:
+        """Monotonic data version, bumped by every applied change"""
+        if self.shared:
+            return self.engine.last_seq
+        return self._version
+
+    def _apply(self, record: Dict):
+        """Apply one mutation record to the listings, indexes and aggregates"""
+        self._version += 1
+        self.modified_at = time.time()
+        op = record["op"]
+        if op in ("add", "update"):
+            incoming = record["listing"]
+            for field, default in FIELD_DEFAULTS.items():
+                incoming.setdefault(field, default)
+            existing = self.listings.get(incoming["id"])
+            if existing is None:
+                self.listings[incoming["id"]] = incoming
+                self._index(incoming)
+                self._notify("added", incoming)
+            elif existing is not incoming:
+                # Update in place so references held by callers stay current
+                self._unindex(existing)
+                existing.update(incoming)
+                self._index(existing)
+                self._notify("updated", existing)
+            self.counter = max(self.counter, incoming["id"])
+        elif op == "delete":
+            listing = self.listings.pop(record["id"], None)
+            if listing is not None:
+                self._unindex(listing)
+                self._notify("removed", listing)
+        elif op == "clear":
+            self._reset()
+            self._notify("cleared", None)
+        elif op == "batch":
+            for sub_record in record["records"]:
+                self._apply(sub_record)
+
+    def _commit(self, record: Dict, expected: Optional[Dict] = None):
+        """
+        Apply a mutation locally, or through the shared engine in commit order.
+
+        `expected` maps listing fields to the values they must still have;
+        shared engines check it in the write transaction and raise
+        StaleWriteError if another worker changed them first. Locally the
+        store lock held by the caller already guarantees it.
+        """
+        with self._lock:
+            if self.shared:
+                try:
+                    self.engine.append(record, expected=expected)
+                finally:
+                    self.sync()
+            else:
+                self._apply(record)
+                if self.engine is not None:
+                    self.engine.append(record)
+
+    def sync(self):
+        """
+        Apply changes committed by other workers (shared engines only).
+
+        Cheap when nothing changed: the engine checks SQLite's data_version
+        before querying its change feed.
+        """
+        if not self.shared:
+            return
+        with self._lock:
+            changes = self.engine.changes()
+            if changes is None:
+                # Fell behind the pruned change feed: reload the full state
+                counter, listings = self.engine.load()
+                self._reset()
+                self._notify("cleared", None)
+                self._load(counter, listings)
+                self.modified_at = time.time()
+                return
+            for record in changes:
+                self._apply(record)
+
+    def next_id(self, name: str, count: int = 1) -> int:
+        """
+        Allocate the next ID in a named sequence ("listing", "order", ...).
+        With `count`, reserve that many consecutive IDs and return the first.
+
+        Atomic across worker processes when the engine is shared.
+        """
+        if self.shared:
+            return self.engine.next_id(name, count)
+        with self._lock:
+            if name == "listing":
+                self.counter += count
+                return self.counter - count + 1
+            self._local_counters[name] = self._local_counters.get(name, 0) + count
+            return self._local_counters[name] - count + 1
+
+    def add(self, crop: str, quantity: int, location: str = "Village X", language: str = "Hindi",
+            quality_verified: bool = True, lat: Optional[float] = None, lon: Optional[float] = None,
+            price: Optional[float] = None) -> Dict:
+        """
+        Add a new listing and index it.
+
+        Args:
+            crop: Name of the crop
+            quantity: Quantity in kilos
+            location: Farmer's location
+            language: Input language
+            quality_verified: Whether the produce passed IoT quality checks
+            lat: Optional latitude of the produce
+            lon: Optional longitude of the produce
+            price: Optional asking price in ₹/kg
+
+        Returns:
+            Dictionary with listing details and ID
+
+        Raises:
+            ValueError: quantity is zero or negative
+        """
+        check_quantity(quantity)
+        listing = new_listing(self.next_id("listing"), crop, quantity, location=location, language=language,
+                              quality_verified=quality_verified, lat=lat, lon=lon, price=price)
+
+        self._commit({"op": "add", "listing": listing})
+        return self.listings.get(listing["id"], listing)
+
+    def add_many(self, items: List[Dict]) -> List[Dict]:
+        """
+        Add several listings in one write.
+
+        IDs are reserved as one block and all listings are committed as a
+        single batch record: one log line or one database transaction, so
+        either all of them persist or none do.
+
+        Args:
+            items: Dicts of add() keyword arguments (crop and quantity required)
+
+        Returns:
+            The new listings, in the order given
+
+        Raises:
+            ValueError: An item's quantity is zero or negative (nothing is added)
+        """
+        if not items:
+            return []
+        for item in items:
+            check_quantity(item["quantity"])
+        first_id = self.next_id("listing", len(items))
+        listings = [new_listing(first_id + offset, **item) for offset, item in enumerate(items)]
+
+        self._commit({"op": "batch", "records": [{"op": "add", "listing": listing} for listing in listings]})
+        return [self.listings.get(listing["id"], listing) for listing in listings]
+
+    def get(self, listing_id: int) -> Optional[Dict]:
+        """Get a listing by ID in O(1), or None if not found"""
+        self.sync()
+        return self.listings.get(listing_id)
+
+    def all(self) -> List[Dict]:
+        """All listings in insertion (ID) order"""
+        self.sync()
+        return list(self.all_ids.after())
+
+    def find(self, field: str, value: str) -> List[Dict]:
+        """
+        Get all listings whose indexed field matches a value.
+
+        Args:
+            field: One of INDEXED_FIELDS
+            value: Value to match (normalized before lookup)
+
+        Returns:
+            List of matching listings in ID order
+        """
+        self.sync()
+        bucket = self.indexes[field].get(normalize_key(value))
+        return list(bucket.after()) if bucket else []
+
+    def query(self, after_id: int = 0, limit: int = 50, min_quantity: Optional[int] = None,
+              **equals) -> List[Dict]:
+        """
+        Keyset-paginated filtered scan in ID order.
+
+        Equality filters are answered from the secondary indexes: the
+        smallest matching bucket drives the walk from `after_id`, the other
+        buckets are O(1) membership checks, and `min_quantity` is checked on
+        each candidate. The scan stops as soon as `limit` listings match.
+
+        Args:
+            after_id: Cursor; only listings with a larger ID are returned
+            limit: Maximum number of listings to return
+            min_quantity: Minimum quantity in kilos
+            **equals: INDEXED_FIELDS name -> required value (None = no filter)
+
+        Returns:
+            Up to `limit` matching listings in ID order
+        """
+        self.sync()
+        buckets = []
+        for field, value in equals.items():
+            if value is None:
+                continue
+            bucket = self.indexes[field].get(normalize_key(value))
+            if bucket is None:
+                return []
+            buckets.append(bucket)
+
+        driver = min(buckets, key=len) if buckets else self.all_ids
+        others = [bucket for bucket in buckets if bucket is not driver]
+
+        page = []
+        for listing in driver.after(after_id):
+            if min_quantity is not None and listing["quantity"] < min_quantity:
+                continue
+            if any(listing["id"] not in bucket for bucket in others):
+                continue
+            page.append(listing)
+            if len(page) >= limit:
+                break
+        return page
+
+    def nearby(self, lat: float, lon: float, radius_km: float, limit: int = 50,
+               crop: Optional[str] = None, status: Optional[str] = "available") -> List[tuple]:
+        """
+        Listings within a radius, nearest first, from the spatial grid.
+
+        Args:
+            lat: Latitude of the search centre
+            lon: Longitude of the search centre
+            radius_km: Search radius in kilometres
+            limit: Maximum number of results
+            crop: Optional crop name to filter by
+            status: Only listings with this status (None = any)
+
+        Returns:
+            Up to `limit` (distance_km, listing) pairs
+        """
+        self.sync()
+        crop_key = normalize_key(crop) if crop else None
+        status_key = normalize_key(status) if status else None
+        results = []
+        for distance, listing in self.grid.within(lat, lon, radius_km):
+            if crop_key is not None and normalize_key(listing["crop"]) != crop_key:
+                continue
+            if status_key is not None and normalize_key(listing["status"]) != status_key:
+                continue
+            results.append((distance, listing))
+            if len(results) >= limit:
+                break
+        return results
+
+    def update_status(self, listing_id: int, status: str) -> Optional[Dict]:
+        """
+        Change a listing's status, keeping the status index in sync.
+
+        Returns:
+            The updated listing or None if not found
+        """
+        with self._lock:
+            listing = self.get(listing_id)
+            if listing is None:
+                return None
+            self._commit({"op": "update", "listing": dict(listing, status=status)})
+            return self.listings.get(listing_id)
+
+    def adjust_quantity(self, listing_id: int, delta: int, retries: int = 5) -> Optional[Dict]:
+        """
+        Atomically add `delta` kilos to a listing's quantity (negative to reserve).
+        Reserved kilos are added to the listing's `quantity_sold`, and
+        returned kilos taken off it again.
+
+        The check and the write happen under the store lock, and with a
+        shared engine the write is conditional on the quantity not having
+        changed in another worker, so two buyers can never both take the
+        last kilos. A listing that reaches 0 becomes "sold"; a sold listing
+        that gets quantity back becomes "available" again.
+
+        Returns:
+            The updated listing, or None if it doesn't exist or has fewer
+            than -delta kilos left
+        """
+        for _ in range(retries):
+            with self._lock:
+                listing = self.get(listing_id)
+                if listing is None:
+                    return None
+                quantity = listing["quantity"] + delta
+                if quantity < 0:
+                    return None
+                status = listing["status"]
+                if quantity == 0:
+                    status = "sold"
+                elif status == "sold":
+                    status = "available"
+                quantity_sold = max(0, listing.get("quantity_sold", 0) - delta)
+                updated = dict(listing, quantity=quantity, status=status, quantity_sold=quantity_sold)
+                try:
+                    self._commit({"op": "update", "listing": updated},
+                                 expected={"quantity": listing["quantity"]})
+                except StaleWriteError:
+                    continue
+                return self.listings.get(listing_id)
+        return None
+
+    def delete(self, listing_id: int) -> bool:
+        """
+        Delete a listing by ID in O(1).
+
+        Returns:
+            True if deleted, False if not found
+        """
+        with self._lock:
+            if self.get(listing_id) is None:
+                return False
+            self._commit({"op": "delete", "id": listing_id})
+            return True
+
+    def clear(self):
+        """Drop all listings and indexes and reset the ID counter"""
+        self._commit({"op": "clear"})
+
+    def stats(self, field: Optional[str] = None, value: Optional[str] = None) -> Dict:
+        """
+        Read running aggregates in O(1).
+
+        Args:
+            field: Optional AGGREGATED_FIELDS entry to read a breakdown for
+            value: Optional value of that field (e.g. a crop name)
+
+        Returns:
+            Store-wide totals, one value's aggregate, or {value: aggregate}
+            for every value of the field
+        """
+        self.sync()
+        if field is None:
+            return dict(self.totals)
+        if value is None:
+            return {key: dict(aggregate) for key, aggregate in self.aggregates[field].items()}
+        return dict(self.aggregates[field].get(normalize_key(value), new_aggregate()))
+
+    def close(self):
+        """Flush and close the durable engine, if any"""
+        if self.engine is not None:
+            self.engine.close()
+
+
+# Storage for farmer listings. In-memory by default; set GAON_STORE_ENGINE=log
+# or sqlite to persist listings across restarts (see persistence.py).
+listing_store = ListingStore(engine=engine_from_env())
+
+def add_listing(crop: str, quantity: int, location: str = "Village X", language: str = "Hindi",
+                quality_verified: bool = True, lat: Optional[float] = None,
+                lon: Optional[float] = None, price: Optional[float] = None) -> Dict:
     """
     Add a new farmer listing to the in-memory store.
-    
+
     Args:
         crop: Name of the crop
         quantity: Quantity in kilos
         location: Farmer's location
         language: Input language
-    
+        quality_verified: Whether the produce passed IoT quality checks
+        lat: Optional latitude of the produce
+        lon: Optional longitude of the produce
+        price: Optional asking price in ₹/kg
+
     Returns:
         Dictionary with listing details and ID
     """
-    global listing_counter
-    listing_counter += 1
-    
-    listing = {
-        "id": listing_counter,
-        "crop": crop,
-        "quantity": quantity,
-        "location": location,
-        "language": language,
-        "timestamp": datetime.now().isoformat(),
-        "status": "available"
-    }
-    
-    listings_db.append(listing)
-    return listing
+    return listing_store.add(crop, quantity, location=location, language=language,
+                             quality_verified=quality_verified, lat=lat, lon=lon, price=price)
+
+def add_listings(items: List[Dict]) -> List[Dict]:
+    """
+    Add several farmer listings in one write (one batch record).
+
+    Args:
+        items: Dicts with add_listing() keyword arguments
+
+    Returns:
+        The new listings, in the order given
+    """
+    return listing_store.add_many(items)
 
 def get_all_listings() -> List[Dict]:
     """
     Retrieve all farmer listings from the in-memory store.
-    
+
     Returns:
         List of all listings
     """
-    return listings_db.copy()
+    return listing_store.all()
 
 def get_listing_by_id(listing_id: int) -> Optional[Dict]:
     """
     Get a specific listing by ID.
-    
+
     Args:
         listing_id: ID of the listing
-    
+
     Returns:
         Listing details or None if not found
     """
-    for listing in listings_db:
-        if listing["id"] == listing_id:
-            return listing
-    return None
+    return listing_store.get(listing_id)
 
 def get_listings_by_crop(crop: str) -> List[Dict]:
     """
     Get all listings for a specific crop.
-    
+
     Args:
         crop: Crop name to filter by
-    
+
     Returns:
         List of listings for that crop
     """
-    return [listing for listing in listings_db if listing["crop"].lower() == crop.lower()]
+    return listing_store.find("crop", crop)
+
+def get_listings_by_location(location: str) -> List[Dict]:
+    """
+    Get all listings at a specific location.
+
+    Args:
+        location: Location to filter by
+
+    Returns:
+        List of listings at that location
+    """
+    return listing_store.find("location", location)
+
+def get_listings_by_status(status: str) -> List[Dict]:
+    """
+    Get all listings with a given status (e.g. "available", "sold").
+
+    Args:
+        status: Status to filter by
+
+    Returns:
+        List of listings with that status
+    """
+    return listing_store.find("status", status)
+
+def query_listings(after_id: int = 0, limit: int = 50, crop: Optional[str] = None,
+                   location: Optional[str] = None, min_quantity: Optional[int] = None,
+                   quality_verified: Optional[bool] = None,
+                   status: Optional[str] = "available") -> List[Dict]:
+    """
+    Get one page of listings matching optional filters, in ID order.
+
+    Args:
+        after_id: Cursor; ID of the last listing of the previous page
+        limit: Page size
+        crop: Crop name to filter by
+        location: Location to filter by
+        min_quantity: Minimum quantity in kilos
+        quality_verified: Only verified (True) or unverified (False) produce
+        status: Only listings with this status (None = any); sold-out
+                listings are "sold", so the default leaves them out
+
+    Returns:
+        Up to `limit` listings with ID > after_id
+    """
+    return listing_store.query(after_id=after_id, limit=limit, min_quantity=min_quantity,
+                               crop=crop, location=location, quality_verified=quality_verified,
+                               status=status)
+
+def get_nearby_listings(lat: float, lon: float, radius_km: float, limit: int = 50,
+                        crop: Optional[str] = None) -> List[tuple]:
+    """
+    Get available listings near a point, nearest first.
+
+    Args:
+        lat: Latitude of the buyer
+        lon: Longitude of the buyer
+        radius_km: Search radius in kilometres
+        limit: Maximum number of results
+        crop: Optional crop name to filter by
+
+    Returns:
+        List of (distance_km, listing) pairs
+    """
+    return listing_store.nearby(lat, lon, radius_km, limit=limit, crop=crop)
+
+def adjust_listing_quantity(listing_id: int, delta: int) -> Optional[Dict]:
+    """
+    Atomically change a listing's quantity (see ListingStore.adjust_quantity).
+
+    Args:
+        listing_id: ID of the listing
+        delta: Kilos to add (negative to reserve/sell)
+
+    Returns:
+        Updated listing, or None if not found or not enough quantity
+    """
+    return listing_store.adjust_quantity(listing_id, delta)
+
+def update_listing_status(listing_id: int, status: str) -> Optional[Dict]:
+    """
+    Update the status of a listing.
+
+    Args:
+        listing_id: ID of the listing
+        status: New status
+
+    Returns:
+        Updated listing or None if not found
+    """
+    return listing_store.update_status(listing_id, status)
+
+def next_order_id() -> int:
+    """
+    Allocate a new order ID (unique across workers with the shared engine).
+
+    Returns:
+        The new order ID
+    """
+    return listing_store.next_id("order")
+
+def get_store_version() -> tuple:
+    """
+    Current data version of the listing store.
+
+    Returns:
+        (version, modified_at) - a monotonically increasing change counter
+        and the UNIX time of the last change
+    """
+    listing_store.sync()
+    return listing_store.version, listing_store.modified_at
+
+def sync_listings():
+    """Apply changes made by other workers (no-op unless the store is shared)"""
+    listing_store.sync()
+
+def add_store_listener(listener: Callable[[str, Optional[Dict]], None]):
+    """
+    Subscribe to listing changes.
+
+    Args:
+        listener: Called as listener(event, listing) with event one of
+            "added", "updated", "removed" or "cleared"
+    """
+    listing_store.add_listener(listener)
+
+def close_store():
+    """Flush pending writes to the durable engine (call on shutdown)"""
+    listing_store.close()
 
 def clear_listings():
     """Clear all listings (for testing/reset)"""
-    global listing_counter
-    global listings_db
-    listings_db = []
-    listing_counter = 0
+    listing_store.clear()
 
 def delete_listing(listing_id: int) -> bool:
     """
     Delete a listing by ID.
-    
+
     Args:
         listing_id: ID of the listing to delete
-    
+
     Returns:
         True if deleted, False if not found
     """
-    global listings_db
-    for i, listing in enumerate(listings_db):
-        if listing["id"] == listing_id:
-            listings_db.pop(i)
-            return True
-    return False
+    return listing_store.delete(listing_id)
 
 def get_store_stats() -> Dict:
     """
     Get statistics about the current listings.
-    
+
     Returns:
         Dictionary with store statistics
     """
-    if not listings_db:
+    listing_store.sync()
+    crops = listing_store.crop_names
+
+    if not listing_store.listings:
         return {
             "total_listings": 0,
             "total_quantity": 0,
             "unique_crops": 0
         }
-    
-    crops = set(listing["crop"] for listing in listings_db)
-    total_quantity = sum(listing["quantity"] for listing in listings_db)
-    
+
     return {
-        "total_listings": len(listings_db),
-        "total_quantity": total_quantity,
+        "total_listings": len(listing_store),
+        "total_quantity": listing_store.totals["total_quantity"],
         "unique_crops": len(crops),
         "crops": list(crops)
     }
+
+def get_market_stats(field: Optional[str] = None, value: Optional[str] = None) -> Dict:
+    """
+    Get running marketplace aggregates.
+
+    Args:
+        field: "crop" or "location" for a breakdown, None for store totals
+        value: Optional single crop/location to read
+
+    Returns:
+        Aggregate dictionary (see ListingStore.stats)
+    """
+    return listing_store.stats(field, value)
@@ -1,5 +1,13 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
+from fastapi import APIRouter, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, ValidationError
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
+from typing import AsyncIterator, Dict, Iterator, List
+from store import add_listings
+from fuzzy import FuzzyIndex, normalize
+import codecs
+import json
 import re
 
 router = APIRouter()
@@ -7,9 +15,26 @@ router = APIRouter()
 class VoiceInput(BaseModel):
     text: str
 
+class VoiceItem(BaseModel):
+    crop: str
+    quantity: int
+    confidence: float = 1.0
+
 class VoiceOutput(BaseModel):
     crop: str
     quantity: int
+    confidence: float = 0.0
+    items: List[VoiceItem] = []
+
+class VoiceBatchItem(VoiceInput):
+    # Used for listings created from the transcript (create_listings=true)
+    location: str = "Village X"
+    language: str = "Hindi"
+
+# Transcripts parsed, and listings committed, together in /voice-input/batch
+BATCH_GROUP_SIZE = 500
+# Longest NDJSON line / JSON array element accepted (bounds buffered input)
+MAX_RECORD_CHARS = 64 * 1024
 
 # Crop mapping - Hindi/Hinglish to English (matching government dataset)
 CROP_MAPPING = {
@@ -68,6 +93,185 @@ CROP_MAPPING = {
     "ginger": "ginger",
 }
 
+QUANTITY_UNITS = ("kilo", "kg", "kgs", "bags", "sacks", "units")
+
+
+def alias_pattern(aliases) -> str:
+    """
+    Regex source matching any alias, built from a character trie.
+
+    Branches at each trie node start with different characters, so the
+    regex engine follows a single path per start position instead of
+    trying every alias: the cost per character of text doesn't grow
+    with the number of aliases. Optional continuations are greedy, so
+    the longest alias wins ("hari mirch" over "mirch", "gehun" over
+    "gehu"). Spaces inside aliases match any run of whitespace.
+    """
+    trie: Dict = {}
+    for alias in aliases:
+        node = trie
+        for char in alias:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def compile_node(node: Dict) -> str:
+        branches = [
+            (r"\s+" if char == " " else re.escape(char)) + compile_node(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            body = "(?:" + body + ")?"
+        return body
+
+    return compile_node(trie)
+
+
+# One pass over the transcript finds quantities and whole-word crop aliases
+# in order. Compiled once at import; aliases are normalized like the text.
+TOKEN_PATTERN = re.compile(
+    r"(?P<quantity>\d+)\s*(?:" + "|".join(QUANTITY_UNITS) + r")?"
+    r"|(?<!\w)(?P<crop>" + alias_pattern(" ".join(alias.lower().split()) for alias in CROP_MAPPING) + r")(?!\w)"
+    r"|(?P<word>[^\W\d_]+)"
+)
+ALIASES = {" ".join(alias.lower().split()): crop for alias, crop in CROP_MAPPING.items()}
+
+# Words that aren't exact aliases are looked up here, for noisy ASR
+# spellings ("tamaatar", "aaloo", "piyaaz")
+FUZZY_INDEX = FuzzyIndex(ALIASES)
+# Common words of farmer utterances that sit within fuzzy range of an
+# alias ("bazaar" ~ "gajar") and are never crops
+FUZZY_IGNORE = set(QUANTITY_UNITS) | {
+    "mere", "mera", "meri", "paas", "pass", "hai", "hain", "aur", "bhi", "mujhe", "hamare",
+    "hamara", "becho", "bechna", "bechni", "bazaar", "bazar", "bajar", "mandi", "quintal",
+    "kilogram", "bori", "rupaye", "rupees", "chahiye", "wala", "wale", "kisan",
+}
+# A fuzzy hit below this confidence is dropped ("price" ~ "rice" is 0.8,
+# "tamaatar" ~ "tamatar" 0.875), unless it only differs from an alias by
+# spelling variants (see fuzzy.normalize(): "aaloo", "piyaaz")
+MIN_FUZZY_CONFIDENCE = 0.85
+
+
+def fuzzy_crop(text: str):
+    """FUZZY_INDEX lookup, keeping only confident matches"""
+    found = FUZZY_INDEX.lookup(text)
+    if found is None:
+        return None
+    if found[2] >= MIN_FUZZY_CONFIDENCE or normalize(text) in FUZZY_INDEX.exact:
+        return found
+    return None
+
+
+def scan_tokens(text: str) -> Iterator[tuple]:
+    """
+    Quantities and crops of a transcript, in order of appearance.
+
+    Yields ("quantity", n) and ("crop", crop, confidence, exact). Words
+    that aren't an exact alias are matched fuzzily; each is held until
+    the next token, so a two-word alias ("phool gobi") is tried before
+    its words alone ("lady" alone would be taken for "paddy").
+    """
+    held = None
+    for match in TOKEN_PATTERN.finditer(" ".join(text.lower().split())):
+        word = match.group("word")
+        if word is not None and word not in FUZZY_IGNORE:
+            found = fuzzy_crop(f"{held} {word}") if held is not None else None
+            if found is not None:
+                held = None
+                yield ("crop", found[1], found[2], False)
+                continue
+            if held is not None:
+                found = fuzzy_crop(held)
+                if found is not None:
+                    yield ("crop", found[1], found[2], False)
+            held = word
+            continue
+
+        if held is not None:
+            found = fuzzy_crop(held)
+            if found is not None:
+                yield ("crop", found[1], found[2], False)
+            held = None
+        if match.group("quantity") is not None:
+            yield ("quantity", int(match.group("quantity")))
+        elif match.group("crop") is not None:
+            yield ("crop", ALIASES[" ".join(match.group("crop").split())], 1.0, True)
+
+    if held is not None:
+        found = fuzzy_crop(held)
+        if found is not None:
+            yield ("crop", found[1], found[2], False)
+
+
+def pair_quantities(tokens: List[tuple], crops: Dict[int, dict], used: set):
+    """
+    Give quantities to the crop items at the given token positions.
+
+    A quantity pairs with the crop right after it ("50 kilo tamatar") or,
+    failing that, with the crop right before it ("tamatar 50 kilo").
+    Crop tokens not in `crops` are skipped, as are quantities in `used`;
+    quantities taken are added to `used`.
+    """
+    pending = None        # position of a quantity waiting for the next crop
+    awaiting = None       # last crop still without a quantity
+    for position, token in enumerate(tokens):
+        if token[0] == "quantity":
+            if position in used:
+                continue
+            if awaiting is not None and pending is None:
+                awaiting["quantity"] = token[1]
+                used.add(position)
+                awaiting = None
+            else:
+                pending = position
+        elif position in crops:
+            item = crops[position]
+            if pending is not None:
+                item["quantity"] = tokens[pending][1]
+                used.add(pending)
+                awaiting = None
+            else:
+                awaiting = item
+            pending = None
+
+
+def extract_crops_and_quantities(text: str) -> List[dict]:
+    """
+    Extract every (crop, quantity) pair from one utterance, in order.
+
+    Quantities go to exact aliases first (see pair_quantities()); fuzzy
+    matches only get the quantities left over, so a misheard word can't
+    take the quantity of a crop named exactly in the same sentence.
+    Crops without a quantity get 0. Each item's confidence is 1.0 for an
+    exact alias and lower the more a fuzzily matched word differs from it.
+
+    Examples:
+    - "50 kilo tamatar aur 20 kilo aloo" -> [{"crop": "tomato", "quantity": 50, ...},
+                                             {"crop": "potato", "quantity": 20, ...}]
+    - "gehu 100 kg, chawal 40 kg" -> [{"crop": "wheat", "quantity": 100, ...},
+                                      {"crop": "rice", "quantity": 40, ...}]
+    - "tamaatar 5 kilo" -> [{"crop": "tomato", "quantity": 5, "confidence": 0.875}]
+    """
+    tokens = list(scan_tokens(text))
+    crops = {
+        position: {"crop": token[1], "quantity": None, "confidence": token[2]}
+        for position, token in enumerate(tokens) if token[0] == "crop"
+    }
+    exact = {position: item for position, item in crops.items() if tokens[position][3]}
+    fuzzy = {position: item for position, item in crops.items() if position not in exact}
+    used = set()
+    pair_quantities(tokens, exact, used)
+    pair_quantities(tokens, fuzzy, used)
+
+    items = list(crops.values())
+    for item in items:
+        if item["quantity"] is None:
+            item["quantity"] = 0
+    return items
+
+
 def extract_crop_and_quantity(text: str) -> dict:
     """
     Extract crop name and quantity from Hindi/Hinglish text.
@@ -76,26 +280,23 @@ def extract_crop_and_quantity(text: str) -> dict:
     - "Mere paas 50 kilo tamatar hai" -> {"crop": "tomato", "quantity": 50}
     - "100 kg aloo" -> {"crop": "potato", "quantity": 100}
     - "mere pass 5kg gehu hai" -> {"crop": "wheat", "quantity": 5}
+
+    The first exact alias mentioned is returned (the most confident fuzzy
+    match if there is none); every pair is under "items".
     """
+    items = extract_crops_and_quantities(text)
+    if not items:
+        quantity_match = re.search(r"\d+", text)
+        quantity = int(quantity_match.group()) if quantity_match else 0
+        return {"crop": "unknown", "quantity": quantity, "confidence": 0.0, "items": []}
     
-    text_lower = text.lower().strip()
-    
-    # Extract quantity (numbers followed by kilo/kg/units)
-    quantity_match = re.search(r'(\d+)\s*(kilo|kg|kgs|bags|sacks|units)?', text_lower)
-    quantity = int(quantity_match.group(1)) if quantity_match else 0
-    
-    # Extract crop name by matching against mapping
-    # Try longest matches first to handle multi-word crops
-    crop_found = "unknown"
-    sorted_crops = sorted(CROP_MAPPING.keys(), key=len, reverse=True)
-    for hindi_crop in sorted_crops:
-        if hindi_crop in text_lower:
-            crop_found = CROP_MAPPING[hindi_crop]
-            break
-    
+    # max() keeps the first of equally confident items
+    top = max(items, key=lambda item: item["confidence"])
     return {
-        "crop": crop_found,
-        "quantity": quantity
+        "crop": top["crop"],
+        "quantity": top["quantity"],
+        "confidence": top["confidence"],
+        "items": items
     }
 
 @router.post("/voice-input", response_model=VoiceOutput)
@@ -111,11 +312,233 @@ async def process_voice_input(voice_input: VoiceInput):
     Returns:
     {
       "crop": "tomato",
-      "quantity": 50
+      "quantity": 50,
+      "confidence": 1.0,
+      "items": [{"crop": "tomato", "quantity": 50, "confidence": 1.0}]
     }
     """
     result = extract_crop_and_quantity(voice_input.text)
     return VoiceOutput(
         crop=result["crop"],
-        quantity=result["quantity"]
+        quantity=result["quantity"],
+        confidence=result["confidence"],
+        items=result["items"]
+    )
+
+
+class BatchFormatError(ValueError):
+    """The batch body is not NDJSON or a JSON array of transcripts"""
+
+
+class RecordDecoder:
+    """
+    Incremental decoder for a body of NDJSON lines or one JSON array.
+
+    feed() takes text as it arrives and returns the records completed so
+    far; only an unfinished record is kept between calls, so memory is
+    bounded by MAX_RECORD_CHARS plus one chunk whatever the body size.
+    The format is chosen from the first character ('[' means array).
+    A line that isn't valid JSON is returned as its ValueError, so one
+    bad line doesn't end the batch; broken array framing does.
+    """
+
+    WHITESPACE = re.compile(r"\s*")
+
+    def __init__(self):
+        self.text = ""
+        self.error = None       # raised on the next call, after the records before it
+        self.is_array = None
+        self.state = "start"    # array: start -> value <-> separator -> done
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, text: str, final: bool = False) -> List:
+        if self.error is not None:
+            raise self.error
+        self.text += text
+        if self.is_array is None:
+            stripped = self.text.lstrip()
+            if not stripped:
+                return []
+            self.is_array = stripped[0] == "["
+        records = []
+        try:
+            records.extend(self._array(final) if self.is_array else self._lines(final))
+        except BatchFormatError as e:
+            self.error = e
+            self.text = ""
+        if len(self.text) > MAX_RECORD_CHARS:
+            self.error = BatchFormatError(f"Record longer than {MAX_RECORD_CHARS} characters")
+            self.text = ""
+        return records
+
+    def close(self):
+        """Call after the final feed(): raises if the body ended badly"""
+        if self.error is not None:
+            raise self.error
+        if self.is_array and self.state != "done":
+            raise BatchFormatError("JSON array is not closed")
+
+    def _lines(self, final: bool) -> Iterator:
+        lines = self.text.split("\n")
+        self.text = "" if final else lines.pop()
+        for line in lines:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    yield e
+
+    def _array(self, final: bool) -> Iterator:
+        text, position = self.text, 0
+        while True:
+            position = self.WHITESPACE.match(text, position).end()
+            if position == len(text):
+                break
+            char = text[position]
+            if self.state == "start":
+                if char != "[":
+                    raise BatchFormatError("Expected a JSON array")
+                self.state = "first"
+                position += 1
+            elif char == "]" and self.state in ("first", "separator"):
+                self.state = "done"
+                position += 1
+            elif self.state in ("first", "value"):
+                try:
+                    record, end = self.decoder.raw_decode(text, position)
+                except ValueError:
+                    if final:
+                        raise BatchFormatError("Invalid JSON in array")
+                    break
+                if end == len(text) and not final:
+                    # A number or literal may continue in the next chunk
+                    break
+                position = end
+                self.state = "separator"
+                yield record
+            elif self.state == "separator" and char == ",":
+                self.state = "value"
+                position += 1
+            else:
+                raise BatchFormatError(f"Unexpected {char!r} in JSON array")
+        self.text = text[position:]
+
+
+def parse_batch_group(records: List, first_index: int, create_listings: bool) -> bytes:
+    """
+    Parse a group of batch records into NDJSON result lines.
+
+    With create_listings, every (crop, quantity > 0) pair becomes a
+    listing; the whole group is added in one store write. Blocking, so
+    stream_voice_batch runs it on the threadpool.
+    """
+    lines = []
+    new_listings = []
+    owners = []
+    for offset, record in enumerate(records):
+        index = first_index + offset
+        if isinstance(record, ValueError):
+            lines.append({"index": index, "error": f"Invalid JSON: {str(record)}"})
+            continue
+        try:
+            item = VoiceBatchItem.model_validate(record)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(map(str, error["loc"]))
+            lines.append({"index": index, "error": f"Invalid transcript: {error['msg']}" + (f" ({field})" if field else "")})
+            continue
+
+        line = {"index": index, **extract_crop_and_quantity(item.text)}
+        if create_listings:
+            line["listing_ids"] = []
+            for pair in line["items"]:
+                if pair["quantity"] > 0:
+                    new_listings.append({"crop": pair["crop"], "quantity": pair["quantity"],
+                                         "location": item.location, "language": item.language})
+                    owners.append(line)
+        lines.append(line)
+
+    if new_listings:
+        try:
+            for owner, listing in zip(owners, add_listings(new_listings)):
+                owner["listing_ids"].append(listing["id"])
+        except Exception as e:
+            print(f"[ERROR] Batch listing creation failed: {str(e)}")
+            for owner in owners:
+                owner["error"] = "Listing creation failed"
+
+    return "".join(json.dumps(line, ensure_ascii=False) + "\n" for line in lines).encode("utf-8")
+
+
+async def stream_voice_batch(chunks: AsyncIterator[bytes], create_listings: bool) -> AsyncIterator[bytes]:
+    """Parse transcripts as body chunks arrive, yielding NDJSON results"""
+    text_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    records = RecordDecoder()
+    index = 0
+    try:
+        finished = False
+        while not finished:
+            try:
+                chunk = await chunks.__anext__()
+                parsed = records.feed(text_decoder.decode(chunk))
+            except StopAsyncIteration:
+                finished = True
+                parsed = records.feed(text_decoder.decode(b"", final=True), final=True)
+            for start in range(0, len(parsed), BATCH_GROUP_SIZE):
+                group = parsed[start:start + BATCH_GROUP_SIZE]
+                # Parsing a group and its store write would stall every
+                # other request (and SSE stream) on the event loop
+                yield await run_in_threadpool(parse_batch_group, group, index, create_listings)
+                index += len(group)
+        records.close()
+    except BatchFormatError as e:
+        yield (json.dumps({"index": index, "error": str(e)}) + "\n").encode("utf-8")
+    except ClientDisconnect:
+        return
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that starts sending while the request body is still
+    being read. Starlette's own (under ASGI servers older than spec 2.4)
+    also reads receive() to watch for disconnects, which would swallow
+    body chunks; here a disconnect surfaces from request.stream() instead.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+@router.post("/voice-input/batch")
+async def process_voice_batch(request: Request, create_listings: bool = False):
+    """
+    Parse many voice transcripts in one streamed request.
+
+    The body is NDJSON (one VoiceInput object per line) or a JSON array of
+    them. Results stream back as NDJSON while the body is still being
+    read, one line per transcript in input order, so gateways can send
+    thousands of utterances without either side buffering them all.
+    
+    Args:
+        create_listings: Also add a listing for every (crop, quantity)
+                         pair found; each group of BATCH_GROUP_SIZE
+                         transcripts is written in one store transaction.
+                         Items may carry "location" and "language".
+    
+    Example input (NDJSON):
+    {"text": "Mere paas 50 kilo tamatar hai"}
+    {"text": "20 kilo aloo aur 10 kilo pyaz", "location": "Nashik"}
+    
+    Returns (NDJSON):
+    {"index": 0, "crop": "tomato", "quantity": 50, "items": [...], "listing_ids": [41]}
+    {"index": 1, "crop": "potato", "quantity": 20, "items": [...], "listing_ids": [42, 43]}
+    
+    A transcript that can't be parsed gets {"index": n, "error": "..."};
+    a malformed body ends the stream with such a line.
+    """
+    return DuplexStreamingResponse(
+        stream_voice_batch(request.stream(), create_listings),
+        media_type="application/x-ndjson"
     )
@@ -0,0 +1,262 @@
+"""
+Streaming ingestion of the government (Agmarknet) mandi price CSV.
+
+The raw dumps can be far larger than memory, so the CSV is read in
+chunks of only the needed columns. Each chunk is cleaned, filtered to
+CROP_MAPPING crops and reduced to compact dtypes (categorical crop and
+market, float32 price, small-int month/year) before the next is read.
+Peak memory is one raw chunk plus the filtered output.
+
+The cleaned dataset is cached as a columnar .npz keyed by the CSV's
+content hash and the cleaning parameters (load_training_data), so later
+runs skip parsing and cleaning entirely.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Raw column -> training name (only these columns are read)
+RAW_COLUMNS = {
+    'Commodity': 'crop',
+    'Modal Price (Rs./Quintal)': 'price',
+    'Market Name': 'market',
+    'Price Date': 'date',
+}
+DATE_FORMAT = '%d %b %Y'
+
+# Raw rows per chunk
+CHUNK_ROWS = 200_000
+
+# Cleaning parameters (part of the cache key)
+OUTLIER_QUANTILES = (0.01, 0.99)
+# Markets with fewer rows are dropped to avoid overfitting
+MIN_MARKET_ROWS = 100
+
+# Bump when the cache layout or cleaning code changes
+CACHE_FORMAT_VERSION = 1
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache')
+
+# Map common crop names to our supported crops
+CROP_MAPPING = {
+    'tomato': 'tomato',
+    'onion': 'onion',
+    'potato': 'potato',
+    'wheat': 'wheat',
+    'rice': 'rice',
+    'bajra(pearl millet/cumbu)': 'bajra',
+    'jowar(sorghum)': 'jowar',
+    'maize': 'maize',
+    'brinjal': 'brinjal',
+    'cabbage': 'cabbage',
+    'cauliflower': 'cauliflower',
+    'green chilli': 'green chilli',
+    'bhindi(ladies finger)': 'bhindi',
+    'carrot': 'carrot',
+    'garlic': 'garlic',
+    'ginger(green)': 'ginger',
+    'apple': 'apple',
+    'banana': 'banana',
+    'mango': 'mango',
+}
+SUPPORTED_CROPS = sorted(set(CROP_MAPPING.values()))
+
+
+def clean_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """
+    Clean one raw chunk down to supported-crop rows with compact dtypes.
+
+    Returns:
+        DataFrame with crop (category), market (category), price (float32,
+        Rs/quintal), date, month (int8) and year (int16)
+    """
+    chunk = chunk.rename(columns=RAW_COLUMNS)
+
+    # Cheapest filter first: unsupported crops are most of an all-India dump
+    crop = chunk['crop'].str.lower().str.strip().map(CROP_MAPPING)
+    price = pd.to_numeric(chunk['price'], errors='coerce').astype(np.float32)
+    keep = crop.notna() & price.notna() & chunk['market'].notna() & chunk['date'].notna()
+    chunk, crop, price = chunk[keep], crop[keep], price[keep]
+
+    date = pd.to_datetime(chunk['date'], format=DATE_FORMAT, errors='coerce')
+    dated = date.notna()
+
+    return pd.DataFrame({
+        'crop': pd.Categorical(crop[dated], categories=SUPPORTED_CROPS),
+        'market': chunk['market'][dated].str.strip().astype('category'),
+        'price': price[dated],
+        'date': date[dated],
+        'month': date[dated].dt.month.astype(np.int8),
+        'year': date[dated].dt.year.astype(np.int16),
+    })
+
+
+def concat_frames(frames: list) -> pd.DataFrame:
+    """Concatenate cleaned chunks, keeping market categorical across chunks"""
+    if not frames:
+        return clean_chunk(pd.DataFrame({column: pd.Series(dtype=object) for column in RAW_COLUMNS}))
+    markets = union_categoricals([frame['market'] for frame in frames], sort_categories=True)
+    df = pd.concat([frame.drop(columns='market') for frame in frames], ignore_index=True)
+    df.insert(1, 'market', markets)
+    return df
+
+
+def read_prices(path: str, chunksize: int = CHUNK_ROWS, since: pd.Timestamp = None) -> tuple:
+    """
+    Stream the raw price CSV into a compact, cleaned DataFrame.
+
+    Args:
+        path: Agmarknet CSV
+        chunksize: Raw rows held in memory at once
+        since: Keep only rows dated after this (None: keep all)
+
+    Returns:
+        (DataFrame as from clean_chunk(), rows read from the CSV)
+    """
+    frames = []
+    rows_read = 0
+    reader = pd.read_csv(
+        path,
+        usecols=list(RAW_COLUMNS),
+        dtype={column: str for column in RAW_COLUMNS},
+        chunksize=chunksize,
+    )
+    for chunk in reader:
+        rows_read += len(chunk)
+        frame = clean_chunk(chunk)
+        if since is not None:
+            frame = frame[frame['date'] > since]
+        frames.append(frame)
+    return concat_frames(frames), rows_read
+
+
+def clean_prices(df: pd.DataFrame) -> tuple:
+    """
+    Remove price outliers and markets with too little data.
+
+    Unused categories are dropped, so crop/market category codes equal
+    what a LabelEncoder fit on the result would assign.
+
+    Returns:
+        (cleaned DataFrame, stats dict for reporting)
+    """
+    low, high = df['price'].quantile(list(OUTLIER_QUANTILES))
+    df = df[(df['price'] >= low) & (df['price'] <= high)]
+    rows_after_outliers = len(df)
+
+    market_counts = df['market'].value_counts()
+    top_markets = market_counts[market_counts >= MIN_MARKET_ROWS].index
+    df = df[df['market'].isin(top_markets)].reset_index(drop=True)
+    df['crop'] = df['crop'].cat.remove_unused_categories()
+    df['market'] = df['market'].cat.remove_unused_categories()
+
+    stats = {
+        'rows_after_outliers': rows_after_outliers,
+        'price_min': float(df['price'].min()) if len(df) else None,
+        'price_max': float(df['price'].max()) if len(df) else None,
+        'markets': len(df['market'].cat.categories),
+        'crops': len(df['crop'].cat.categories),
+    }
+    return df, stats
+
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(source_hash: str) -> str:
+    """Cache key: source content plus everything that shapes the cleaned data"""
+    params = {
+        'source': source_hash,
+        'format': CACHE_FORMAT_VERSION,
+        'columns': RAW_COLUMNS,
+        'date_format': DATE_FORMAT,
+        'crop_mapping': CROP_MAPPING,
+        'outlier_quantiles': OUTLIER_QUANTILES,
+        'min_market_rows': MIN_MARKET_ROWS,
+    }
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def save_frame(df: pd.DataFrame, path: str, meta: dict):
+    """
+    Write a DataFrame column by column to an uncompressed .npz.
+    Categorical columns are stored as codes + categories.
+    """
+    arrays = {}
+    columns = []
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            arrays[f'{name}.codes'] = column.cat.codes.to_numpy()
+            arrays[f'{name}.categories'] = np.array(column.cat.categories.tolist(), dtype=str)
+            columns.append((name, 'category'))
+        else:
+            arrays[name] = column.to_numpy()
+            columns.append((name, str(column.dtype)))
+    meta = {**meta, 'columns': columns}
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_frame(path: str) -> tuple:
+    """
+    Read a DataFrame written by save_frame().
+
+    Returns:
+        (DataFrame, meta dict)
+    """
+    with np.load(path, allow_pickle=False) as arrays:
+        meta = json.loads(bytes(arrays['meta']).decode('utf-8'))
+        data = {}
+        for name, kind in meta['columns']:
+            if kind == 'category':
+                data[name] = pd.Categorical.from_codes(
+                    arrays[f'{name}.codes'], categories=arrays[f'{name}.categories'].tolist()
+                )
+            else:
+                data[name] = arrays[name]
+    return pd.DataFrame(data), meta
+
+
+def load_training_data(path: str, cache_dir: str = CACHE_DIR, refresh: bool = False) -> tuple:
+    """
+    The cleaned training dataset for a raw price CSV, from cache if possible.
+
+    Args:
+        path: Agmarknet CSV
+        cache_dir: Where cached datasets live (one file per cache key)
+        refresh: Rebuild even if a cached copy exists
+
+    Returns:
+        (DataFrame, info dict: cache key/path, whether it was a cache hit,
+         rows read and cleaning stats)
+    """
+    key = cache_key(file_hash(path))
+    cache_path = os.path.join(cache_dir, f'prices-{key}.npz')
+    if not refresh and os.path.exists(cache_path):
+        try:
+            df, meta = load_frame(cache_path)
+            return df, {**meta['info'], 'cached': True, 'cache_path': cache_path}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[WARN] Ignoring unreadable dataset cache {cache_path}: {str(e)}")
+
+    df, rows_read = read_prices(path)
+    rows_supported = len(df)
+    df, stats = clean_prices(df)
+    info = {'key': key, 'source': os.path.abspath(path), 'rows_read': rows_read,
+            'rows_supported': rows_supported, **stats}
+
+    os.makedirs(cache_dir, exist_ok=True)
+    save_frame(df, cache_path, {'info': info})
+    return df, {**info, 'cached': False, 'cache_path': cache_path}
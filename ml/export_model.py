@@ -0,0 +1,102 @@
+"""
+Export a trained price model to a compact, memory-mappable forest file.
+
+The RandomForestRegressor's trees are flattened into contiguous NumPy
+arrays and written, with the label encoder classes and training info,
+as an uncompressed .npz that backend/price.py memory-maps and evaluates
+with NumPy alone (no sklearn/scipy at serving time).
+
+Usage:
+    python ml/export_model.py [price_model.pkl] [price_model.npz]
+"""
+import json
+import os
+import pickle
+import sys
+import numpy as np
+
+# Bump when the array layout changes; the backend refuses other versions
+FORMAT_VERSION = 1
+
+
+def flatten_forest(model) -> dict:
+    """
+    Concatenate every tree's nodes into shared arrays.
+
+    Child indexes are global (offset by the tree's position in the arrays)
+    and leaves point to themselves, so an evaluator can step all trees
+    max_depth times without checking for leaves.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        own = np.arange(tree.node_count, dtype=np.int32) + offset
+        leaf = tree.children_left == -1
+        features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(leaf, own, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(leaf, own, tree.children_right + offset).astype(np.int32))
+        values.append(tree.value[:, 0, 0].astype(np.float64))
+        roots.append(offset)
+        offset += tree.node_count
+        max_depth = max(max_depth, tree.max_depth)
+
+    return {
+        "feature": np.concatenate(features),
+        "threshold": np.concatenate(thresholds),
+        "left": np.concatenate(lefts),
+        "right": np.concatenate(rights),
+        "value": np.concatenate(values),
+        "roots": np.array(roots, dtype=np.int32),
+        "max_depth": max_depth,
+    }
+
+
+def export_model(model_data: dict, path: str):
+    """
+    Write a pickled-model dict (as saved by train_model.py) to `path`.
+
+    The file is written next to the target and renamed into place, so a
+    running backend never sees a half-written artifact.
+    """
+    forest = flatten_forest(model_data['model'])
+    crops = model_data['le_crop'].classes_.tolist()
+    markets = model_data['le_market'].classes_.tolist()
+    meta = {
+        'format_version': FORMAT_VERSION,
+        'max_depth': forest.pop('max_depth'),
+        'price_unit': model_data.get('price_unit', 'quintal'),
+        'supported_crops': model_data.get('supported_crops', crops),
+        'supported_markets': model_data.get('supported_markets', markets),
+        'training_date': model_data.get('training_date'),
+        'data_rows': model_data.get('data_rows'),
+        'r2_score': model_data.get('r2_score'),
+        'update_r2_score': model_data.get('update_r2_score'),
+        'data_end': model_data.get('data_end'),
+        'lineage': model_data.get('lineage', []),
+    }
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        # np.savez stores members uncompressed, which keeps them mappable
+        np.savez(
+            f,
+            meta=np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8),
+            crops=np.array(crops, dtype=str),
+            markets=np.array(markets, dtype=str),
+            **forest
+        )
+    os.replace(tmp_path, path)
+
+
+if __name__ == '__main__':
+    ml_dir = os.path.dirname(__file__)
+    pickle_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(ml_dir, 'price_model.pkl')
+    npz_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(pickle_path)[0] + '.npz'
+
+    with open(pickle_path, 'rb') as f:
+        model_data = pickle.load(f)
+    export_model(model_data, npz_path)
+    print(f"[OK] Exported {len(model_data['model'].estimators_)} trees to {npz_path}")
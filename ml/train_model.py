@@ -1,14 +1,17 @@
-import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 import pickle
 import os
+import time
 from datetime import datetime
+from dataset import CHUNK_ROWS, load_training_data
+from export_model import export_model
 
 # Set paths
 data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'prices..csv')
 model_path = os.path.join(os.path.dirname(__file__), 'price_model.pkl')
+forest_path = os.path.join(os.path.dirname(__file__), 'price_model.npz')
 
 print("="*70)
 print("GAON BAZAR - ML MODEL TRAINING (Government Dataset)")
@@ -16,78 +19,22 @@ print("="*70)
 
 # Load dataset
 print(f"\n[1/6] Loading government dataset from {data_path}...")
-df = pd.read_csv(data_path)
-print(f"[OK] Dataset loaded: {df.shape[0]:,} rows, {df.shape[1]} columns")
-
-# Display column names
-print(f"\nColumns: {df.columns.tolist()}")
+started = time.perf_counter()
+df, data_info = load_training_data(data_path)
+if data_info['cached']:
+    print(f"[OK] Cleaned dataset loaded from cache {data_info['cache_path']} in {time.perf_counter() - started:.1f}s")
+else:
+    print(f"[INFO] Streamed in chunks of {CHUNK_ROWS:,} rows, keeping only supported crops")
+    print(f"[OK] Dataset cleaned in {time.perf_counter() - started:.1f}s and cached at {data_info['cache_path']}")
+print(f"[OK] {data_info['rows_read']:,} rows read, {data_info['rows_supported']:,} with supported crops and valid price/market/date")
 
 # DATA CLEANING & PREPROCESSING
 print(f"\n[2/6] Data cleaning and preprocessing...")
 
-# Rename columns for consistency
-df = df.rename(columns={
-    'Commodity': 'crop',
-    'Modal Price (Rs./Quintal)': 'price',
-    'Market Name': 'market',
-    'Price Date': 'date',
-    'State': 'state'
-})
-
-# Extract month and year from date
-df['date'] = pd.to_datetime(df['date'], format='%d %b %Y', errors='coerce')
-df['month'] = df['date'].dt.month
-df['year'] = df['date'].dt.year
-
-# Handle missing values
-initial_rows = len(df)
-df = df.dropna(subset=['crop', 'price', 'month', 'year', 'market'])
-print(f"[OK] Removed {initial_rows - len(df):,} rows with missing values")
-
-# Convert price from Quintal (100kg) to Per Kg for user-friendly output
 # Modal price is in Rs/Quintal, we'll keep it as is and handle conversion in API
-df['price'] = pd.to_numeric(df['price'], errors='coerce')
-df = df.dropna(subset=['price'])
-
-# Remove unrealistic prices (outliers)
-q1 = df['price'].quantile(0.01)
-q99 = df['price'].quantile(0.99)
-df = df[(df['price'] >= q1) & (df['price'] <= q99)]
-print(f"[OK] Removed outliers. Price range: ₹{df['price'].min():.2f} - ₹{df['price'].max():.2f} per quintal")
-
-# Normalize crop names (lowercase, strip whitespace)
-df['crop'] = df['crop'].str.lower().str.strip()
-df['market'] = df['market'].str.strip()
-
-# Map common crop names to our supported crops
-CROP_MAPPING = {
-    'tomato': 'tomato',
-    'onion': 'onion',
-    'potato': 'potato',
-    'wheat': 'wheat',
-    'rice': 'rice',
-    'bajra(pearl millet/cumbu)': 'bajra',
-    'jowar(sorghum)': 'jowar',
-    'maize': 'maize',
-    'brinjal': 'brinjal',
-    'cabbage': 'cabbage',
-    'cauliflower': 'cauliflower',
-    'green chilli': 'green chilli',
-    'bhindi(ladies finger)': 'bhindi',
-    'carrot': 'carrot',
-    'garlic': 'garlic',
-    'ginger(green)': 'ginger',
-    'apple': 'apple',
-    'banana': 'banana',
-    'mango': 'mango',
-}
-
-# Filter only supported crops
-df['crop'] = df['crop'].map(CROP_MAPPING)
-df = df.dropna(subset=['crop'])
-
-print(f"[OK] Cleaned dataset: {len(df):,} rows remaining")
-print(f"[OK] Unique crops: {df['crop'].nunique()}")
+print(f"[OK] Removed outliers. Price range: ₹{data_info['price_min']:.2f} - ₹{data_info['price_max']:.2f} per quintal")
+print(f"[OK] Cleaned dataset: {data_info['rows_after_outliers']:,} rows remaining")
+print(f"[OK] Unique crops: {data_info['crops']}")
 print(f"[OK] Date range: {df['year'].min()} to {df['year'].max()}")
 
 # FEATURE ENGINEERING
@@ -95,12 +42,8 @@ print(f"\n[3/6] Feature engineering...")
 
 # Select features for training
 # We'll use: crop, month, market as features
-# Simplified approach: use only major markets to avoid overfitting
-market_counts = df['market'].value_counts()
-top_markets = market_counts[market_counts >= 100].index.tolist()
-df = df[df['market'].isin(top_markets)]
-
-print(f"[OK] Using {len(top_markets)} major markets with sufficient data")
+# Simplified approach: only major markets (MIN_MARKET_ROWS+ rows) are kept to avoid overfitting
+print(f"[OK] Using {data_info['markets']} major markets with sufficient data")
 print(f"[OK] Final training dataset: {len(df):,} rows")
 
 # Prepare features and target
@@ -143,21 +86,40 @@ print(f"[OK] Prediction std deviation: ₹{std_residual:.2f} (lower is more stab
 
 # MODEL SAVING
 print(f"\n[5/6] Saving model to {model_path}...")
+model_data = {
+    'model': model,
+    'le_crop': le_crop,
+    'le_market': le_market,
+    'supported_crops': le_crop.classes_.tolist(),
+    'supported_markets': le_market.classes_.tolist(),
+    'price_unit': 'quintal',  # Important: prices are per quintal (100kg)
+    'training_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+    'data_rows': len(df),
+    'r2_score': train_score,
+    # Incremental updates (update_model.py) start from here
+    'data_end': df['date'].max().strftime('%Y-%m-%d'),
+    'price_bounds': (data_info['price_min'], data_info['price_max']),
+    'base_trees': len(model.estimators_),
+    'lineage': [{
+        'kind': 'full',
+        'trained_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'source': data_info['key'],
+        'data_start': df['date'].min().strftime('%Y-%m-%d'),
+        'data_end': df['date'].max().strftime('%Y-%m-%d'),
+        'rows': len(df),
+        'trees_added': len(model.estimators_),
+        'trees_dropped': 0,
+    }],
+}
 with open(model_path, 'wb') as f:
-    pickle.dump({
-        'model': model,
-        'le_crop': le_crop,
-        'le_market': le_market,
-        'supported_crops': le_crop.classes_.tolist(),
-        'supported_markets': le_market.classes_.tolist(),
-        'price_unit': 'quintal',  # Important: prices are per quintal (100kg)
-        'training_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-        'data_rows': len(df),
-        'r2_score': train_score
-    }, f)
+    pickle.dump(model_data, f)
 
 print("[OK] Model saved successfully!")
 
+# Flattened forest the backend memory-maps and evaluates without sklearn
+export_model(model_data, forest_path)
+print(f"[OK] Serving artifact exported to {forest_path}")
+
 # TEST PREDICTION
 print(f"\n[6/6] Testing model predictions...")
 print("-" * 70)
@@ -190,5 +152,6 @@ print(f"✓ Supported crops: {len(le_crop.classes_)}")
 print(f"✓ Supported markets: {len(le_market.classes_)}")
 print(f"✓ Training accuracy: {train_score:.4f}")
 print(f"✓ Model saved to: {model_path}")
+print(f"✓ Serving artifact: {forest_path}")
 print(f"✓ Demo-ready: YES (stable predictions enabled)")
 print("="*70)
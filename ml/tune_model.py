@@ -0,0 +1,256 @@
+"""
+Time-aware hyperparameter search for the price model.
+
+Each parameter set is scored with rolling-origin cross-validation: for
+each of the last FOLDS months, train on everything before that month
+and predict it, so scores say how the model does on next month's
+prices rather than on rows it has seen. (parameters, fold) fits run in
+parallel on a process pool; the feature matrix is written once to .npy
+files that every worker memory-maps read-only, so workers share one
+copy instead of each receiving a pickled one.
+
+The report lists out-of-sample MAE, fit time, single-row predict
+latency and forest size (which drives the serving table build and the
+exported artifact) for every parameter set, and recommends the fastest
+to serve among those within MAE_TOLERANCE of the best.
+
+Usage:
+    python ml/tune_model.py [--folds 4] [--workers N] [--data path.csv]
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestRegressor
+from dataset import load_training_data
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'prices..csv')
+REPORT_DIR = os.path.join(os.path.dirname(__file__), 'reports')
+
+# Test months (each trained on all earlier data)
+FOLDS = 4
+
+# The current train_model.py settings are part of the grid, as the baseline
+PARAM_GRID = {
+    'n_estimators': [25, 50, 100],
+    'max_depth': [6, 8, 12],
+    'min_samples_leaf': [5, 20],
+    'min_samples_split': [10],
+}
+BASELINE = {'n_estimators': 50, 'max_depth': 8, 'min_samples_leaf': 5, 'min_samples_split': 10}
+
+# Candidates this close to the best MAE (relative) count as equally accurate
+MAE_TOLERANCE = 0.02
+
+# Single-row predictions timed per fit (serving predicts one row at a time)
+LATENCY_SAMPLES = 50
+
+# Shared read-only arrays, memory-mapped once per worker process
+_shared = {}
+
+
+def rolling_origin_folds(dates: pd.Series, folds: int = FOLDS) -> list:
+    """
+    Expanding-window folds over calendar months.
+
+    Returns:
+        [(test month label, train row indexes, test row indexes)], oldest first
+    """
+    months = dates.dt.to_period('M')
+    periods = sorted(months.unique())
+    if len(periods) <= folds:
+        raise ValueError(f"Need more than {folds} months of data for {folds} folds, have {len(periods)}")
+    codes = months.to_numpy()
+    result = []
+    for period in periods[-folds:]:
+        result.append((
+            str(period),
+            np.flatnonzero(codes < period),
+            np.flatnonzero(codes == period),
+        ))
+    return result
+
+
+def parameter_sets(grid: dict = None) -> list:
+    """Every combination in the grid (PARAM_GRID by default), plus BASELINE"""
+    grid = grid or PARAM_GRID
+    names = sorted(grid)
+    sets = [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+    if BASELINE not in sets:
+        sets.append(dict(BASELINE))
+    return sets
+
+
+def _init_worker(shared_dir: str):
+    """Process pool initializer: map the shared arrays read-only"""
+    for name in ('X', 'y', 'folds'):
+        _shared[name] = np.load(os.path.join(shared_dir, f'{name}.npy'), mmap_mode='r', allow_pickle=False)
+    with open(os.path.join(shared_dir, 'folds.json')) as f:
+        _shared['fold_bounds'] = json.load(f)
+
+
+def evaluate(params: dict, fold: int) -> dict:
+    """Fit one parameter set on one fold (runs in a worker process)"""
+    X, y, order = _shared['X'], _shared['y'], _shared['folds']
+    train_start, train_end, test_end = _shared['fold_bounds'][fold]
+    train_rows = order[train_start:train_end]
+    test_rows = order[train_end:test_end]
+
+    model = RandomForestRegressor(random_state=42, n_jobs=1, **params)
+    started = time.perf_counter()
+    model.fit(X[train_rows], y[train_rows])
+    fit_seconds = time.perf_counter() - started
+
+    X_test = np.asarray(X[test_rows])
+    predictions = model.predict(X_test)
+    mae = float(np.mean(np.abs(predictions - y[test_rows])))
+
+    samples = X_test[:LATENCY_SAMPLES]
+    started = time.perf_counter()
+    for row in samples:
+        model.predict(row.reshape(1, -1))
+    predict_ms = (time.perf_counter() - started) / max(len(samples), 1) * 1000
+
+    return {
+        'params': params,
+        'fold': fold,
+        'mae': mae,
+        'fit_seconds': fit_seconds,
+        'predict_ms': predict_ms,
+        'nodes': int(sum(estimator.tree_.node_count for estimator in model.estimators_)),
+    }
+
+
+def write_shared(directory: str, df: pd.DataFrame, folds: list):
+    """
+    Write features, target and fold row indexes for the workers.
+
+    Fold rows are stored as one index array ordered [train | test] per
+    fold boundary: the training rows of fold k are a prefix of those of
+    fold k+1, so one time-sorted order plus (start, end) bounds covers
+    every fold.
+    """
+    X = np.column_stack([
+        df['crop'].cat.codes.to_numpy(),
+        df['month'].to_numpy(),
+        df['market'].cat.codes.to_numpy(),
+    ]).astype(np.float32)
+    y = df['price'].to_numpy(dtype=np.float64)
+    order = np.argsort(df['date'].to_numpy(), kind='stable')
+
+    position = np.empty(len(order), dtype=np.int64)
+    position[order] = np.arange(len(order))
+    bounds = []
+    for _, train_rows, test_rows in folds:
+        train_end = len(train_rows)
+        test_end = train_end + len(test_rows)
+        # Time-sorted order puts each fold's train rows, then its test rows, first
+        assert position[test_rows].min() == train_end and position[test_rows].max() == test_end - 1
+        bounds.append((0, train_end, test_end))
+
+    np.save(os.path.join(directory, 'X.npy'), X)
+    np.save(os.path.join(directory, 'y.npy'), y)
+    np.save(os.path.join(directory, 'folds.npy'), order)
+    with open(os.path.join(directory, 'folds.json'), 'w') as f:
+        json.dump(bounds, f)
+
+
+def summarize(results: list, folds: list) -> pd.DataFrame:
+    """One row per parameter set, averaged over folds, best MAE first"""
+    rows = []
+    for result in results:
+        rows.append({**result['params'], 'fold': folds[result['fold']][0],
+                     **{key: result[key] for key in ('mae', 'fit_seconds', 'predict_ms', 'nodes')}})
+    per_fold = pd.DataFrame(rows)
+    names = sorted(PARAM_GRID)
+    summary = per_fold.groupby(names).agg(
+        mae=('mae', 'mean'),
+        mae_std=('mae', 'std'),
+        fit_seconds=('fit_seconds', 'mean'),
+        predict_ms=('predict_ms', 'mean'),
+        nodes=('nodes', 'mean'),
+    ).reset_index().sort_values('mae').reset_index(drop=True)
+    summary['baseline'] = [
+        all(row[name] == BASELINE[name] for name in names) for _, row in summary.iterrows()
+    ]
+    return summary
+
+
+def recommend(summary: pd.DataFrame) -> pd.Series:
+    """Fastest to serve (fewest nodes, then predict latency) among near-best MAE"""
+    best = summary['mae'].min()
+    accurate = summary[summary['mae'] <= best * (1 + MAE_TOLERANCE)]
+    return accurate.sort_values(['nodes', 'predict_ms']).iloc[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin CV grid search for the price model")
+    parser.add_argument('--data', default=DATA_PATH)
+    parser.add_argument('--folds', type=int, default=FOLDS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--out', default=REPORT_DIR)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("GAON BAZAR - PRICE MODEL TUNING (rolling-origin CV)")
+    print("=" * 70)
+
+    df, data_info = load_training_data(args.data)
+    print(f"[OK] Dataset: {len(df):,} rows ({'cached' if data_info['cached'] else 'parsed'})")
+
+    folds = rolling_origin_folds(df['date'], args.folds)
+    for label, train_rows, test_rows in folds:
+        print(f"[INFO] Fold {label}: train {len(train_rows):,} rows, test {len(test_rows):,} rows")
+
+    candidates = parameter_sets()
+    tasks = [(params, fold) for params in candidates for fold in range(len(folds))]
+    print(f"[INFO] {len(candidates)} parameter sets x {len(folds)} folds = {len(tasks)} fits on {args.workers} workers")
+
+    started = time.perf_counter()
+    results = []
+    with tempfile.TemporaryDirectory(prefix='gaon-tune-') as shared_dir:
+        write_shared(shared_dir, df, folds)
+        del df
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(shared_dir,)) as pool:
+            futures = [pool.submit(evaluate, params, fold) for params, fold in tasks]
+            for done, future in enumerate(as_completed(futures), 1):
+                results.append(future.result())
+                if done % max(1, len(tasks) // 10) == 0 or done == len(tasks):
+                    print(f"[INFO] {done}/{len(tasks)} fits done ({time.perf_counter() - started:.0f}s)")
+
+    summary = summarize(results, folds)
+    choice = recommend(summary)
+
+    os.makedirs(args.out, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    csv_path = os.path.join(args.out, f'tuning-{stamp}.csv')
+    json_path = os.path.join(args.out, f'tuning-{stamp}.json')
+    summary.to_csv(csv_path, index=False)
+    with open(json_path, 'w') as f:
+        json.dump({
+            'data': data_info,
+            'folds': [{'month': label, 'train_rows': len(train), 'test_rows': len(test)}
+                      for label, train, test in folds],
+            'mae_tolerance': MAE_TOLERANCE,
+            'recommended': {name: choice[name].item() for name in sorted(PARAM_GRID)},
+            'results': json.loads(summary.to_json(orient='records')),
+            'elapsed_seconds': time.perf_counter() - started,
+        }, f, indent=2)
+
+    print("\n" + summary.to_string(index=False, float_format=lambda value: f"{value:.3f}"))
+    print("\n" + "=" * 70)
+    print(f"✓ Recommended: {', '.join(f'{name}={choice[name]}' for name in sorted(PARAM_GRID))}")
+    print(f"  MAE ₹{choice['mae']:.2f}/quintal, {int(choice['nodes']):,} nodes, {choice['predict_ms']:.2f} ms/prediction")
+    print(f"✓ Report: {csv_path}")
+    print(f"✓ Details: {json_path}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
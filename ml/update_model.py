@@ -0,0 +1,205 @@
+"""
+Incremental daily refresh of the price model.
+
+Instead of retraining on the full history (train_model.py), an update
+ingests only price rows newer than the model's `data_end` and:
+
+  - extends the crop/market label encoders with newly seen names,
+    appending them so existing codes (and the trees that use them) keep
+    their meaning;
+  - warm-starts ADD_TREES new trees on a sliding window of the last
+    WINDOW_DAYS of data (the new rows plus recent history, so new trees
+    see more than one day), keeping the full-history base trees;
+  - keeps at most MAX_INCREMENTAL_TREES added trees, dropping the oldest.
+
+Each update appends an entry to the artifact's `lineage`, so a model can
+be traced back to its full build and every delta applied since. Rebuild
+with train_model.py every so often (REBUILD_AFTER_DAYS) so the base trees
+learn the newer seasons too.
+
+Usage:
+    python ml/update_model.py [--data delta_or_full.csv] [--window-days 90]
+"""
+import argparse
+import os
+import pickle
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from dataset import MIN_MARKET_ROWS, file_hash, read_prices
+from export_model import export_model
+
+DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'prices..csv')
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'price_model.pkl')
+
+# Recent history the added trees are fit on
+WINDOW_DAYS = 90
+# Trees added per update, and the cap on added trees kept in the forest
+ADD_TREES = 10
+MAX_INCREMENTAL_TREES = 50
+# Suggest a full rebuild once the base trees' data is this old
+REBUILD_AFTER_DAYS = 90
+
+
+def extend_encoder(encoder, names) -> list:
+    """
+    Append unseen names to a fitted LabelEncoder without renumbering.
+
+    Returns:
+        Names added (in code order)
+    """
+    known = set(encoder.classes_.tolist())
+    added = sorted(set(names) - known)
+    if added:
+        encoder.classes_ = np.concatenate([encoder.classes_, np.array(added, dtype=encoder.classes_.dtype)])
+    return added
+
+
+def select_window(window: pd.DataFrame, model_data: dict) -> pd.DataFrame:
+    """
+    Clean window rows the way train_model.py cleaned the full dataset:
+    prices outside the full build's outlier bounds are dropped, and a
+    market the model doesn't know yet needs MIN_MARKET_ROWS rows in the
+    window to be added.
+    """
+    low, high = model_data.get('price_bounds') or (None, None)
+    if low is not None:
+        window = window[(window['price'] >= low) & (window['price'] <= high)]
+
+    known = set(model_data['le_market'].classes_.tolist())
+    counts = window['market'].value_counts()
+    keep = [market for market, count in counts.items() if market in known or count >= MIN_MARKET_ROWS]
+    return window[window['market'].isin(keep)].reset_index(drop=True)
+
+
+def add_trees(model, X: pd.DataFrame, y: pd.Series, base_trees: int, seed: int) -> tuple:
+    """
+    Warm-start ADD_TREES trees on (X, y), then drop the oldest added
+    trees beyond MAX_INCREMENTAL_TREES (base trees are never dropped).
+
+    Returns:
+        (trees added, trees dropped)
+    """
+    before = len(model.estimators_)
+    model.set_params(warm_start=True, n_estimators=before + ADD_TREES, random_state=seed)
+    model.fit(X, y)
+    model.set_params(warm_start=False)
+    added = len(model.estimators_) - before
+
+    excess = len(model.estimators_) - base_trees - MAX_INCREMENTAL_TREES
+    if excess > 0:
+        model.estimators_ = model.estimators_[:base_trees] + model.estimators_[base_trees + excess:]
+    dropped = max(excess, 0)
+    model.set_params(n_estimators=len(model.estimators_))
+    return added, dropped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the price model with rows newer than it has seen")
+    parser.add_argument('--data', default=DATA_PATH, help="Full price CSV or a daily delta")
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--window-days', type=int, default=WINDOW_DAYS)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("GAON BAZAR - INCREMENTAL MODEL UPDATE")
+    print("=" * 70)
+    started = time.perf_counter()
+
+    with open(args.model, 'rb') as f:
+        model_data = pickle.load(f)
+    model = model_data['model']
+    if 'data_end' not in model_data:
+        raise SystemExit("[ERROR] Model has no data_end (trained before incremental updates); run train_model.py once")
+    data_end = pd.Timestamp(model_data['data_end'])
+    base_trees = model_data.get('base_trees', len(model.estimators_))
+    print(f"[OK] Loaded model trained on data up to {data_end:%Y-%m-%d} ({len(model.estimators_)} trees)")
+
+    # Only rows within the window are kept while streaming
+    window_start = data_end - pd.Timedelta(days=args.window_days)
+    window, rows_read = read_prices(args.data, since=window_start)
+    new_rows = int((window['date'] > data_end).sum())
+    print(f"[OK] {rows_read:,} rows read, {len(window):,} in the {args.window_days}-day window, {new_rows:,} new")
+    if new_rows == 0:
+        print(f"[OK] Nothing newer than {data_end:%Y-%m-%d}; model unchanged")
+        return
+
+    window = select_window(window, model_data)
+    new = window[window['date'] > data_end]
+    if new.empty:
+        print("[WARN] All new rows were outliers or from markets with too little data; model unchanged")
+        return
+
+    le_crop, le_market = model_data['le_crop'], model_data['le_market']
+    new_crops = extend_encoder(le_crop, window['crop'].unique().tolist())
+    new_markets = extend_encoder(le_market, window['market'].unique().tolist())
+    if new_crops or new_markets:
+        print(f"[OK] New crops: {new_crops or 'none'}; new markets: {new_markets or 'none'}")
+
+    X = pd.DataFrame({
+        'crop': le_crop.transform(window['crop'].astype(str)),
+        'month': window['month'].astype(np.int64),
+        'market': le_market.transform(window['market'].astype(str)),
+    })
+    y = window['price'].astype(np.float64)
+    is_new = (window['date'] > data_end).to_numpy()
+
+    # New rows are unseen, so this is an honest check of the current model
+    mae_before = float(np.mean(np.abs(model.predict(X[is_new]) - y[is_new])))
+
+    seed = int(window['date'].max().strftime('%Y%m%d'))
+    added, dropped = add_trees(model, X, y, base_trees, seed)
+    mae_after = float(np.mean(np.abs(model.predict(X[is_new]) - y[is_new])))
+    print(f"[OK] Added {added} trees on {len(window):,} window rows, dropped {dropped} oldest added trees")
+    print(f"[OK] MAE on new rows: ₹{mae_before:.2f} before (out-of-sample), ₹{mae_after:.2f} after, per quintal")
+
+    new_end = window['date'].max()
+    model_data.update({
+        'supported_crops': le_crop.classes_.tolist(),
+        'supported_markets': le_market.classes_.tolist(),
+        'training_date': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'data_rows': model_data.get('data_rows', 0) + len(new),
+        # r2_score stays the full build's; this one covers only the window
+        'update_r2_score': float(model.score(X, y)),
+        'data_end': new_end.strftime('%Y-%m-%d'),
+        'base_trees': base_trees,
+    })
+    model_data.setdefault('lineage', []).append({
+        'kind': 'incremental',
+        'trained_at': model_data['training_date'],
+        'source': file_hash(args.data)[:16],
+        'data_start': (data_end + pd.Timedelta(days=1)).strftime('%Y-%m-%d'),
+        'data_end': model_data['data_end'],
+        'rows': len(new),
+        'window_rows': len(window),
+        'trees_added': added,
+        'trees_dropped': dropped,
+        'new_crops': new_crops,
+        'new_markets': new_markets,
+        'mae_before': mae_before,
+        'mae_after': mae_after,
+    })
+
+    tmp_path = args.model + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(model_data, f)
+    os.replace(tmp_path, args.model)
+    forest_path = os.path.splitext(args.model)[0] + '.npz'
+    export_model(model_data, forest_path)
+
+    base = next((entry for entry in reversed(model_data['lineage']) if entry['kind'] == 'full'), None)
+    if base and (new_end - pd.Timestamp(base['data_end'])).days > REBUILD_AFTER_DAYS:
+        print(f"[INFO] Base trees stop at {base['data_end']}; consider a full rebuild with train_model.py")
+
+    print("\n" + "=" * 70)
+    print(f"✓ Data through {model_data['data_end']} ({len(model_data['lineage']) - 1} updates since the full build)")
+    print(f"✓ Trees: {len(model.estimators_)} ({base_trees} base)")
+    print(f"✓ Model saved to: {args.model}")
+    print(f"✓ Serving artifact: {forest_path}")
+    print(f"✓ Update took {time.perf_counter() - started:.1f}s")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    main()
@@ -119,6 +119,26 @@ try:
         print(f"  Quantity: {data['quantity']} kg")
         print(f"  Message: {data['message']}")
     
+    # Voice transcripts where a common word sits near a crop alias
+    # ("price" ~ "rice"); the exact alias must keep its quantity
+    print("\n\n=== Step 6: Voice Input Regressions ===")
+    url = "http://127.0.0.1:8000/api/voice-input"
+    cases = [
+        ("mandi price batao 20 kilo tamatar", "tomato", 20),
+        ("aaj ka price kya hai, 50 kilo pyaz", "onion", 50),
+        ("20 kilo lady finger", "bhindi", 20),
+        ("tamaatar 5 kilo", "tomato", 5),
+    ]
+
+    for text, crop, quantity in cases:
+        response = requests.post(url, json={"text": text})
+        data = response.json()
+        found = [item["crop"] for item in data["items"]]
+        if data["crop"] == crop and data["quantity"] == quantity and found == [crop]:
+            print(f"[OK] {text!r} -> {crop}, {quantity} kg")
+        else:
+            print(f"[ERROR] {text!r} -> {data['crop']}, {data['quantity']} kg, items {found} (expected {crop}, {quantity} kg)")
+
     print("\n\n" + "="*60)
     print("END-TO-END FLOW WORKING!")
     print("="*60)
@@ -128,6 +148,7 @@ try:
     print("3. IoT verifies quality conditions ✓")
     print("4. Buyer sees listings with price + quality ✓")
     print("5. Buyer confirms order ✓")
+    print("6. Voice input keeps exact crops ✓")
     print("\n[INFO] Using WHEAT from government dataset")
     print("[INFO] Supported crops: wheat, apple, banana, maize, bajra, etc.")
 